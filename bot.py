@@ -9,11 +9,13 @@ UX Design:
 """
 import sys
 import io
-# Force UTF-8 output on Windows
-if hasattr(sys.stdout, 'buffer'):
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-if hasattr(sys.stderr, 'buffer'):
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+# Force UTF-8 output on Windows (not in report workers, which re-import
+# this file as __mp_main__)
+if __name__ == "__main__":
+    if hasattr(sys.stdout, 'buffer'):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    if hasattr(sys.stderr, 'buffer'):
+        sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 import asyncio
 import logging
@@ -21,18 +23,22 @@ import os
 import re
 from datetime import date
 
-from aiogram import Bot, Dispatcher, F
+from aiogram import Bot, Dispatcher, F, Router
 from aiogram.filters import Command, CommandStart
 from aiogram.types import (
-    Message, CallbackQuery,
+    Message, CallbackQuery, PollAnswer,
     InlineKeyboardMarkup, InlineKeyboardButton,
     ReplyKeyboardMarkup, KeyboardButton,
-    ReplyKeyboardRemove, BotCommand
+    ReplyKeyboardRemove, BotCommand, BufferedInputFile
 )
 from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 
-load_dotenv()
+# Report workers re-import this file as __mp_main__; everything with side
+# effects is kept behind __name__ == "__main__" or inside main(). Workers
+# inherit the environment loaded here.
+if __name__ == "__main__":
+    load_dotenv()
 
 from config import BOT_TOKEN, ADMIN_CHAT_ID
 from db import (
@@ -40,18 +46,22 @@ from db import (
     log_session, mark_block_done, mark_block_skipped,
     compute_weak_topics, get_streak, get_today_plan,
     is_onboarded, get_user_profile, save_calibration,
-    update_user_routine, start_block_session, clear_active_session
+    update_user_routine, start_block_session, clear_active_session,
+    close_db
 )
 from planning import (
     generate_daily_plan, format_plan_message,
     format_block_message, get_exam_countdown,
-    format_profile_message
+    format_profile_message, get_next_pending_block
 )
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
-from syllabus import get_syllabus_summary, get_books_list
-from questions import start_mock, handle_mock_answer, format_mock_history, has_active_mock
+from syllabus import get_syllabus_summary, get_books_list, warm_syllabus_cache
+from questions import (
+    start_mock, handle_mock_answer, handle_mock_poll_answer,
+    format_mock_history, has_active_mock
+)
 from diagnostic import (
     start_diagnostic, handle_diagnostic_answer,
     has_active_diagnostic, is_diagnostic_callback
@@ -60,20 +70,18 @@ from reports import generate_daily_report
 from scheduler import setup_scheduler, register_user_for_notifications
 
 # ── Logging ───────────────────────────────────────────────────────────────────
-logging.basicConfig(
-    stream=sys.stdout,
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    datefmt="%H:%M:%S",
-)
+if __name__ == "__main__":
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        datefmt="%H:%M:%S",
+    )
 log = logging.getLogger("rpsc_bot")
 
-if not BOT_TOKEN:
-    log.critical("Stopping: No BOT_TOKEN found. Check your environment variables.")
-    sys.exit(1)
-
-bot = Bot(token=BOT_TOKEN)
-dp  = Dispatcher(storage=MemoryStorage())
+# Handlers register on the router; the Bot and Dispatcher are built in main()
+router = Router()
+bot: Bot | None = None
 
 
 # ════════════════════════════════════════════════════════════════════════════
@@ -270,7 +278,7 @@ class RoutineStates(StatesGroup):
 # ════════════════════════════════════════════════════════════════════════════
 # /start — Onboard new users with diagnostic; returning users see home
 # ════════════════════════════════════════════════════════════════════════════
-@dp.message(CommandStart())
+@router.message(CommandStart())
 async def cmd_start(msg: Message, state: FSMContext) -> None:
     uid  = msg.from_user.id
     user = await get_or_create_user(
@@ -321,25 +329,25 @@ async def cmd_start(msg: Message, state: FSMContext) -> None:
         )
 
 # ── ROUTINE HANDLERS ────────────────────────────────────────────────────────
-@dp.message(RoutineStates.WAKE_UP)
+@router.message(RoutineStates.WAKE_UP)
 async def process_wake_up(msg: Message, state: FSMContext) -> None:
     await state.update_data(wake_up=msg.text)
     await msg.answer("🍱 *Lunch time?* (e.g., 13:00, 14:00)")
     await state.set_state(RoutineStates.LUNCH)
 
-@dp.message(RoutineStates.LUNCH)
+@router.message(RoutineStates.LUNCH)
 async def process_lunch(msg: Message, state: FSMContext) -> None:
     await state.update_data(lunch=msg.text)
     await msg.answer("☕ *Evening Snack/Tea time?* (e.g., 17:00, 18:00)")
     await state.set_state(RoutineStates.SNACK)
 
-@dp.message(RoutineStates.SNACK)
+@router.message(RoutineStates.SNACK)
 async def process_snack(msg: Message, state: FSMContext) -> None:
     await state.update_data(snack=msg.text)
     await msg.answer("🌙 *Dinner time?* (e.g., 20:30, 21:00)")
     await state.set_state(RoutineStates.DINNER)
 
-@dp.message(RoutineStates.DINNER)
+@router.message(RoutineStates.DINNER)
 async def process_dinner(msg: Message, state: FSMContext) -> None:
     data = await state.get_data()
     data['dinner'] = msg.text
@@ -359,7 +367,7 @@ async def process_dinner(msg: Message, state: FSMContext) -> None:
 # ════════════════════════════════════════════════════════════════════════════
 # /today — shortcut
 # ════════════════════════════════════════════════════════════════════════════
-@dp.message(Command("today"))
+@router.message(Command("today"))
 async def cmd_today_shortcut(msg: Message) -> None:
     await _show_today_plan(msg.from_user.id, msg.chat.id)
 
@@ -367,7 +375,7 @@ async def cmd_today_shortcut(msg: Message) -> None:
 # ════════════════════════════════════════════════════════════════════════════
 # /done — shortcut  e.g.  /done 90 8/10
 # ════════════════════════════════════════════════════════════════════════════
-@dp.message(Command("done"))
+@router.message(Command("done"))
 async def cmd_done_shortcut(msg: Message) -> None:
     await msg.answer(
         "🚫 *Manual logging is disabled.*\n\n"
@@ -383,7 +391,7 @@ async def cmd_done_shortcut(msg: Message) -> None:
 # ════════════════════════════════════════════════════════════════════════════
 # /mock — shortcut
 # ════════════════════════════════════════════════════════════════════════════
-@dp.message(Command("mock"))
+@router.message(Command("mock"))
 async def cmd_mock_shortcut(msg: Message) -> None:
     uid = msg.from_user.id
     if has_active_mock(uid) or has_active_diagnostic(uid):
@@ -400,7 +408,7 @@ async def cmd_mock_shortcut(msg: Message) -> None:
 # ════════════════════════════════════════════════════════════════════════════
 # /help — user manual
 # ════════════════════════════════════════════════════════════════════════════
-@dp.message(Command("help"))
+@router.message(Command("help"))
 async def cmd_help(msg: Message) -> None:
     await msg.answer(USER_MANUAL, parse_mode="Markdown", reply_markup=kb_home())
 
@@ -408,7 +416,7 @@ async def cmd_help(msg: Message) -> None:
 # ════════════════════════════════════════════════════════════════════════════
 # /admin — restrict to ADMIN_CHAT_ID
 # ════════════════════════════════════════════════════════════════════════════
-@dp.message(Command("admin"))
+@router.message(Command("admin"))
 async def cmd_admin_dashboard(msg: Message) -> None:
     if str(msg.from_user.id) != str(ADMIN_CHAT_ID):
         await msg.answer("🚫 *Private Command:* Access Denied.")
@@ -418,10 +426,18 @@ async def cmd_admin_dashboard(msg: Message) -> None:
     await _admin_daily_report(bot)
 
 
+# ════════════════════════════════════════════════════════════════════════════
+# MOCK QUIZ POLL ANSWERS
+# ════════════════════════════════════════════════════════════════════════════
+@router.poll_answer()
+async def on_poll_answer(poll_answer: PollAnswer) -> None:
+    await handle_mock_poll_answer(poll_answer, bot)
+
+
 # ════════════════════════════════════════════════════════════════════════════
 # MASTER CALLBACK HANDLER — all buttons route here
 # ════════════════════════════════════════════════════════════════════════════
-@dp.callback_query()
+@router.callback_query()
 async def on_callback(cb: CallbackQuery) -> None:
     data = cb.data or ""
     uid  = cb.from_user.id
@@ -459,7 +475,7 @@ async def on_callback(cb: CallbackQuery) -> None:
         await cb.message.edit_reply_markup(reply_markup=None)
         await bot.send_message(
             cid,
-            f"🚀 *{label}*\n{num} questions | ➕+1 ➖-1/3\n_Answer with the buttons below each question._",
+            f"🚀 *{label}*\n{num} questions | ➕+1 ➖-1/3\n_Answer each quiz question by tapping an option._",
             parse_mode="Markdown"
         )
         await start_mock(uid, bot, cid, paper=paper, section=section, num_questions=num)
@@ -521,13 +537,12 @@ async def on_callback(cb: CallbackQuery) -> None:
             await _show_next_block(uid, cid)
 
         elif action == "block_start":
-            plan    = await get_today_plan(uid)
-            pending = [b for b in plan if b.get('status') == 'pending']
-            if not pending:
+            next_b = await get_next_pending_block(uid)
+            if not next_b:
                 await cb.answer("No pending blocks.", show_alert=True)
                 return
             
-            block_idx = pending[0]['block_index']
+            block_idx = next_b['block_index']
             await start_block_session(uid, block_idx)
             await bot.send_message(
                 cid,
@@ -594,10 +609,9 @@ async def on_callback(cb: CallbackQuery) -> None:
 
         elif action == "skip":
             profile = await get_user_profile(uid)
-            plan    = await get_today_plan(uid)
-            pending = [b for b in plan if b.get('status') == 'pending']
+            next_b  = await get_next_pending_block(uid)
             
-            if not pending:
+            if not next_b:
                 await bot.send_message(cid, "❌ No pending blocks to skip.")
                 return
 
@@ -617,8 +631,8 @@ async def on_callback(cb: CallbackQuery) -> None:
                     )
                     return
 
-            block_idx = pending[0].get('block_index', 0)
-            label     = pending[0].get('label', 'Block')
+            block_idx = next_b.get('block_index', 0)
+            label     = next_b.get('label', 'Block')
             await mark_block_skipped(uid, block_idx)
             await clear_active_session(uid)
             await bot.send_message(
@@ -659,12 +673,11 @@ async def on_callback(cb: CallbackQuery) -> None:
             name = cb.from_user.first_name or "Student"
             await bot.send_message(cid, "⚙️ Generating your PDF report…")
             try:
-                pdf_path = await generate_daily_report(uid, name)
-                with open(pdf_path, 'rb') as f:
-                    await bot.send_document(
-                        cid, f,
-                        caption=f"📄 RPSC Report — {date.today().strftime('%d %b %Y')}",
-                    )
+                pdf = await generate_daily_report(uid, name)
+                await bot.send_document(
+                    cid, BufferedInputFile(pdf, filename=f"report_{date.today().isoformat()}.pdf"),
+                    caption=f"📄 RPSC Report — {date.today().strftime('%d %b %Y')}",
+                )
             except Exception as e:
                 log.error(f"Report error: {e}")
                 await bot.send_message(
@@ -719,6 +732,7 @@ async def _show_today_plan(uid: int, cid: int) -> None:
 
     if not blocks:
         await bot.send_message(cid, "⚙️ Building your personalised plan…")
+        # Saved before replying, so a quick "Next Block" tap finds this plan
         blocks = await generate_daily_plan(uid)
 
     plan_txt  = await format_plan_message(blocks, daily_hours=daily_h)
@@ -733,13 +747,12 @@ async def _show_today_plan(uid: int, cid: int) -> None:
 
 
 async def _show_next_block(uid: int, cid: int) -> None:
-    plan = await get_today_plan(uid)
-    if not plan:
-        plan = await generate_daily_plan(uid)
-        plan = await get_today_plan(uid)
+    next_b = await get_next_pending_block(uid)
+    if next_b is None and not await get_today_plan(uid):
+        await generate_daily_plan(uid)
+        next_b = await get_next_pending_block(uid)
 
-    pending = [b for b in plan if b.get('status') == 'pending']
-    if not pending:
+    if not next_b:
         await bot.send_message(
             cid,
             "🎉 *All blocks done for today!*\nAmazing work — use the button below to get your report.",
@@ -751,7 +764,6 @@ async def _show_next_block(uid: int, cid: int) -> None:
         )
         return
 
-    next_b    = pending[0]
     block_num = next_b.get('block_index', 0) + 1
     text      = await format_block_message(next_b, block_num)
     await bot.send_message(
@@ -820,12 +832,11 @@ async def _show_weak(uid: int, cid: int) -> None:
 async def _log_done(uid: int, cid: int, minutes: int,
                     correct: int, total_q: int) -> None:
     hours = round(minutes / 60, 2)
-    plan    = await get_today_plan(uid)
-    pending = [b for b in plan if b.get('status') == 'pending']
+    next_b   = await get_next_pending_block(uid)
     topic_id = None
-    if pending:
-        topic_id  = pending[0].get('topic_id')
-        block_idx = pending[0].get('block_index', 0)
+    if next_b:
+        topic_id  = next_b.get('topic_id')
+        block_idx = next_b.get('block_index', 0)
         await mark_block_done(uid, block_idx)
 
     await log_session(uid, topic_id, hours, total_q, correct)
@@ -873,7 +884,7 @@ async def _log_done(uid: int, cid: int, minutes: int,
 # ════════════════════════════════════════════════════════════════════════════
 # Fallback for any typed message
 # ════════════════════════════════════════════════════════════════════════════
-@dp.message()
+@router.message()
 async def cmd_fallback(msg: Message) -> None:
     await msg.answer(
         "👇 Use the buttons or type /help",
@@ -905,6 +916,7 @@ async def on_startup() -> None:
     os.makedirs("data",    exist_ok=True)
     os.makedirs("reports", exist_ok=True)
     await init_db()
+    await warm_syllabus_cache()
 
     # Only 5 commands shown in the Telegram menu
     await bot.set_my_commands([
@@ -919,22 +931,31 @@ async def on_startup() -> None:
 
 
 async def main() -> None:
+    global bot
     if not BOT_TOKEN:
         log.error("BOT_TOKEN not set! Bot cannot start.")
         return
 
+    bot = Bot(token=BOT_TOKEN)
+    dp  = Dispatcher(storage=MemoryStorage())
+    dp.include_router(router)
+
     # 1. Start Health Check Server IMMEDIATELY for Railway/Hosting
     import threading
     threading.Thread(target=run_health_check_server, daemon=True).start()
 
     # 2. Register DB and Tasks
     dp.startup.register(on_startup)
+    dp.shutdown.register(close_db)
     
     log.info("🚀 Starting Bot Polling...")
     await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
 
 if __name__ == "__main__":
+    if not BOT_TOKEN:
+        log.critical("Stopping: No BOT_TOKEN found. Check your environment variables.")
+        sys.exit(1)
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
@@ -3,16 +3,26 @@ db.py - Database layer for RPSC Study Bot (aiosqlite)
 Auto-creates all tables and loads CSV/JSON data on first run.
 Includes adaptive intelligence tables: user_profiles, daily_calibration.
 """
+import asyncio
 import json
 import csv
 import os
+import random
+import time
 import aiosqlite
+from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
 from datetime import date, datetime
 from config import DB_PATH, BIOLOGY_CSV, PAPER1_CSV, QUESTIONS_JSON
 
 # ────────────────────────────────────────────────────────────────────────────
 # SCHEMA
 # ────────────────────────────────────────────────────────────────────────────
+# Stored in PRAGMA user_version once init_db has applied SCHEMA_SQL and seeded.
+# Bump whenever SCHEMA_SQL changes so existing databases pick the change up.
+SCHEMA_VERSION = 2
+
 SCHEMA_SQL = """
 PRAGMA journal_mode=WAL;
 
@@ -80,6 +90,9 @@ CREATE TABLE IF NOT EXISTS topics (
     free_pdf_link   TEXT
 );
 
+CREATE INDEX IF NOT EXISTS idx_topics_paper_section
+    ON topics(paper, section);
+
 CREATE TABLE IF NOT EXISTS daily_plan (
     plan_id     INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id     INTEGER NOT NULL,
@@ -96,6 +109,9 @@ CREATE TABLE IF NOT EXISTS daily_plan (
     FOREIGN KEY (topic_id) REFERENCES topics(topic_id)
 );
 
+CREATE INDEX IF NOT EXISTS idx_daily_plan_user_date
+    ON daily_plan(user_id, plan_date, block_index);
+
 CREATE TABLE IF NOT EXISTS sessions (
     session_id      INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id         INTEGER NOT NULL,
@@ -165,18 +181,74 @@ CREATE TABLE IF NOT EXISTS questions (
 );
 """
 
+# Shared read connection (see get_db)
+_shared_db: aiosqlite.Connection | None = None
+_shared_db_lock = asyncio.Lock()
+
+# Diagnostic test composition: (section, number of questions), in display order
+DIAGNOSTIC_MIX = [("History", 3), ("Geography", 3), ("Polity", 2),
+                  ("SrSec", 5), ("Grad", 5), ("Pedagogy", 3),
+                  ("MentalAbility", 5)]
+
+# ────────────────────────────────────────────────────────────────────────────
+# SHARED CONNECTION
+# ────────────────────────────────────────────────────────────────────────────
+async def get_db() -> aiosqlite.Connection:
+    """
+    Process-wide connection for frequent read-mostly queries (user list,
+    topic catalogue), opened on first use. WAL lets it read while other
+    connections write.
+    """
+    global _shared_db
+    if _shared_db is None:
+        async with _shared_db_lock:
+            if _shared_db is None:
+                conn = await aiosqlite.connect(DB_PATH)
+                cur = await conn.execute("PRAGMA journal_mode=WAL")
+                mode = (await cur.fetchone())[0]
+                if mode != "wal":
+                    print(f"  [DB] WARNING: journal_mode is {mode}, not wal")
+                await conn.executescript(
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA temp_store=MEMORY;"
+                    "PRAGMA cache_size=-64000;"
+                )
+                conn.row_factory = aiosqlite.Row
+                _shared_db = conn
+    return _shared_db
+
+
+async def close_db() -> None:
+    global _shared_db
+    if _shared_db is not None:
+        await _shared_db.close()
+        _shared_db = None
+
+
 # ────────────────────────────────────────────────────────────────────────────
 # INIT
 # ────────────────────────────────────────────────────────────────────────────
 async def init_db() -> None:
-    """Create schema and load seed data (idempotent)."""
+    """Create schema and load seed data; a no-op once at SCHEMA_VERSION."""
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     async with aiosqlite.connect(DB_PATH) as db:
+        cur = await db.execute("PRAGMA user_version")
+        if (await cur.fetchone())[0] == SCHEMA_VERSION:
+            print("[OK] Database up to date at", DB_PATH)
+            return
         await db.executescript(SCHEMA_SQL)
         await db.commit()
         await _seed_topics(db)
         await _seed_questions(db)
+        # Only stamp once seeding took; a DB created without the seed files
+        # must retry on the next start
+        cur = await db.execute(
+            "SELECT EXISTS(SELECT 1 FROM topics) AND EXISTS(SELECT 1 FROM questions)"
+        )
+        if (await cur.fetchone())[0]:
+            await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         await db.commit()
+    clear_topic_cache()
     print("[OK] Database initialised at", DB_PATH)
 
 
@@ -432,12 +504,26 @@ async def save_diagnostic_results(
 
 async def update_topic_accuracy(user_id: int, section: str, accuracy: float) -> None:
     """Update a single topic accuracy in the JSON profile."""
-    profile = await get_user_profile(user_id)
-    if not profile:
+    await update_topic_accuracies(user_id, {section: accuracy})
+
+
+async def update_topic_accuracies(user_id: int, acc_dict: dict[str, float]) -> None:
+    """Merge several section accuracies into the JSON profile in one round-trip."""
+    if not acc_dict:
         return
-    ta = profile.get('topic_accuracy', {})
-    ta[section] = round(accuracy, 2)
     async with aiosqlite.connect(DB_PATH) as db:
+        cur = await db.execute(
+            "SELECT topic_accuracy FROM user_profiles WHERE user_id=?", (user_id,)
+        )
+        row = await cur.fetchone()
+        if not row:
+            return
+        try:
+            ta = json.loads(row[0] or '{}')
+        except Exception:
+            ta = {}
+        for section, accuracy in acc_dict.items():
+            ta[section] = round(accuracy, 2)
         await db.execute(
             "UPDATE user_profiles SET topic_accuracy=? WHERE user_id=?",
             (json.dumps(ta), user_id)
@@ -551,6 +637,24 @@ async def get_today_plan(user_id: int) -> list[dict]:
         return [dict(r) for r in rows]
 
 
+async def get_next_pending_plan_block(user_id: int) -> dict | None:
+    """First pending block of today's plan, read straight off the plan index."""
+    today = date.today().isoformat()
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        cur = await db.execute(
+            """SELECT dp.*, t.name as topic_name, t.free_pdf_link, t.recommended_books
+               FROM daily_plan dp
+               LEFT JOIN topics t ON dp.topic_id = t.topic_id
+               WHERE dp.user_id=? AND dp.plan_date=? AND dp.status='pending'
+               ORDER BY dp.block_index
+               LIMIT 1""",
+            (user_id, today)
+        )
+        row = await cur.fetchone()
+        return dict(row) if row else None
+
+
 async def save_daily_plan(user_id: int, blocks: list[dict]) -> None:
     today = date.today().isoformat()
     async with aiosqlite.connect(DB_PATH) as db:
@@ -558,15 +662,15 @@ async def save_daily_plan(user_id: int, blocks: list[dict]) -> None:
             "DELETE FROM daily_plan WHERE user_id=? AND plan_date=?",
             (user_id, today)
         )
-        for i, b in enumerate(blocks):
-            await db.execute(
-                """INSERT INTO daily_plan
-                   (user_id,plan_date,block_index,topic_id,label,section,paper,hours,emoji,status)
-                   VALUES (?,?,?,?,?,?,?,?,?,'pending')""",
-                (user_id, today, i,
-                 b.get('topic_id'), b.get('label'), b.get('section'),
-                 b.get('paper'), b.get('hours'), b.get('emoji'))
-            )
+        await db.executemany(
+            """INSERT INTO daily_plan
+               (user_id,plan_date,block_index,topic_id,label,section,paper,hours,emoji,status)
+               VALUES (?,?,?,?,?,?,?,?,?,'pending')""",
+            [(user_id, today, i,
+              b.get('topic_id'), b.get('label'), b.get('section'),
+              b.get('paper'), b.get('hours'), b.get('emoji'))
+             for i, b in enumerate(blocks)]
+        )
         await db.commit()
 
 
@@ -629,18 +733,55 @@ async def get_today_stats(user_id: int) -> dict:
             (user_id, today)
         )
         p_row  = await p_cur.fetchone()
-        hours, total_q, correct = row
-        plan_total = p_row[0] or 0
-        plan_done  = p_row[1] or 0
-        accuracy   = (correct / total_q * 100) if total_q > 0 else 0
-        return {
-            "total_hours":   round(float(hours), 2),
-            "total_q":       int(total_q),
-            "total_correct": int(correct),
-            "accuracy":      round(accuracy, 1),
-            "plan_total":    plan_total,
-            "plan_done":     plan_done,
-        }
+        return _today_stats_dict(*row, *p_row)
+
+
+def _today_stats_dict(hours, total_q, correct, plan_total, plan_done) -> dict:
+    plan_total = plan_total or 0
+    plan_done  = plan_done or 0
+    accuracy   = (correct / total_q * 100) if total_q > 0 else 0
+    return {
+        "total_hours":   round(float(hours), 2),
+        "total_q":       int(total_q),
+        "total_correct": int(correct),
+        "accuracy":      round(accuracy, 1),
+        "plan_total":    plan_total,
+        "plan_done":     plan_done,
+    }
+
+
+async def get_today_stats_bulk(user_ids: list[int]) -> dict[int, dict]:
+    """get_today_stats for many users in two grouped queries per chunk."""
+    today = date.today().isoformat()
+    sessions: dict[int, tuple] = {}
+    plans: dict[int, tuple]    = {}
+    async with aiosqlite.connect(DB_PATH) as db:
+        for i in range(0, len(user_ids), 500):   # stay under SQLite's variable limit
+            chunk = user_ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            cur = await db.execute(
+                f"""SELECT user_id,
+                          COALESCE(SUM(hours_studied),0),
+                          COALESCE(SUM(questions_done),0),
+                          COALESCE(SUM(correct_answers),0)
+                   FROM sessions WHERE session_date=? AND user_id IN ({marks})
+                   GROUP BY user_id""",
+                (today, *chunk)
+            )
+            for uid, *vals in await cur.fetchall():
+                sessions[uid] = vals
+            cur = await db.execute(
+                f"""SELECT user_id, COUNT(*), SUM(CASE WHEN status='done' THEN 1 ELSE 0 END)
+                   FROM daily_plan WHERE plan_date=? AND user_id IN ({marks})
+                   GROUP BY user_id""",
+                (today, *chunk)
+            )
+            for uid, *vals in await cur.fetchall():
+                plans[uid] = vals
+    return {
+        uid: _today_stats_dict(*sessions.get(uid, (0, 0, 0)), *plans.get(uid, (0, 0)))
+        for uid in user_ids
+    }
 
 
 async def get_weekly_stats(user_id: int) -> list[dict]:
@@ -775,27 +916,109 @@ async def get_admin_leaderboard() -> dict:
 # ────────────────────────────────────────────────────────────────────────────
 # TOPIC & WEAK TOPIC HELPERS
 # ────────────────────────────────────────────────────────────────────────────
-async def get_all_topics(paper: int | None = None) -> list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        if paper:
-            cur = await db.execute(
-                "SELECT * FROM topics WHERE paper=? ORDER BY priority DESC, marks_weight DESC",
-                (paper,)
-            )
-        else:
-            cur = await db.execute(
-                "SELECT * FROM topics ORDER BY paper, priority DESC"
-            )
-        return [dict(r) for r in await cur.fetchall()]
+@dataclass(slots=True, frozen=True)
+class Topic:
+    """One row of the topics table; field order matches _TOPIC_COLS."""
+    topic_id: int
+    name: str
+    paper: int
+    section: str
+    target_hours: float
+    marks_weight: int
+    priority: str
+    pyq_weight: int | None
+    recommended_books: str
+    free_pdf_link: str
+
+
+_TOPIC_COLS = ("topic_id, name, paper, section, target_hours, marks_weight, "
+               "priority, pyq_weight, recommended_books, free_pdf_link")
+
+
+async def get_all_topics(paper: int | None = None) -> list[Topic]:
+    return (await _fetch_topics(paper))[0]
+
+
+async def _fetch_topics(paper: int | None) -> tuple[list[Topic], dict[str, int]]:
+    """Topics for one paper (or all) plus {section: SUM(marks_weight)}, in one query."""
+    db = await get_db()
+    section_sum = "SUM(marks_weight) OVER (PARTITION BY section)"
+    if paper:
+        cur = await db.execute(
+            f"SELECT {_TOPIC_COLS}, {section_sum} FROM topics WHERE paper=? "
+            "ORDER BY priority DESC, marks_weight DESC, topic_id",
+            (paper,)
+        )
+    else:
+        cur = await db.execute(
+            f"SELECT {_TOPIC_COLS}, {section_sum} FROM topics "
+            "ORDER BY paper, priority DESC, topic_id"
+        )
+    topics, totals = [], {}
+    for *cols, section_total in await cur.fetchall():
+        t = Topic(*cols)
+        topics.append(t)
+        totals[t.section] = section_total
+    return topics, totals
+
+
+# ── Topic cache ─────────────────────────────────────────────────────────────
+# Topics only change when init_db() seeds them, so plans, /syllabus and
+# /books share one in-process copy per paper. Section mark totals come from
+# the same query, so they always match the cached list.
+TOPIC_CACHE_TTL = 600   # seconds
+_TOPIC_CACHE: dict[int | None, tuple[float, tuple[list[Topic], dict[str, int]]]] = {}
+_TOPIC_LOCKS: dict[int | None, asyncio.Lock] = {}
+
+
+async def get_cached_topics_with_totals(
+        paper: int | None = None) -> tuple[list[Topic], dict[str, int]]:
+    """(topics, {section: total marks}) served from memory for up to TOPIC_CACHE_TTL."""
+    hit = _TOPIC_CACHE.get(paper)
+    if hit and time.monotonic() - hit[0] < TOPIC_CACHE_TTL:
+        return hit[1]
+    # One fetch per paper on a cold cache; concurrent callers wait for it
+    async with _TOPIC_LOCKS.setdefault(paper, asyncio.Lock()):
+        hit = _TOPIC_CACHE.get(paper)
+        if hit and time.monotonic() - hit[0] < TOPIC_CACHE_TTL:
+            return hit[1]
+        data = await _fetch_topics(paper)
+        _TOPIC_CACHE[paper] = (time.monotonic(), data)
+        return data
+
+
+async def get_cached_topics(paper: int | None = None) -> list[Topic]:
+    """get_all_topics() served from memory for up to TOPIC_CACHE_TTL."""
+    return (await get_cached_topics_with_totals(paper))[0]
+
+
+def clear_topic_cache() -> None:
+    """Drop cached topic lists — call after editing the topics table."""
+    _TOPIC_CACHE.clear()
+
+
+async def get_distinct_books() -> list[dict]:
+    """One topic per free_pdf_link (the first by paper, section), in that order."""
+    db = await get_db()
+    cur = await db.execute(
+        """SELECT name, section, recommended_books, free_pdf_link FROM (
+               SELECT *, ROW_NUMBER() OVER (
+                   PARTITION BY free_pdf_link
+                   ORDER BY paper, section, priority DESC, topic_id
+               ) AS rn
+               FROM topics
+           )
+           WHERE rn = 1
+           ORDER BY paper, section, priority DESC, topic_id"""
+    )
+    return [dict(r) for r in await cur.fetchall()]
 
 
-async def get_topic(topic_id: int) -> dict | None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM topics WHERE topic_id=?", (topic_id,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
+async def get_topic(topic_id: int) -> Topic | None:
+    db = await get_db()
+    cur = await db.execute(f"SELECT {_TOPIC_COLS} FROM topics WHERE topic_id=?", (topic_id,))
+    row = await cur.fetchone()
+    return Topic(*row) if row else None
 
 
 async def compute_weak_topics(user_id: int) -> list[dict]:
@@ -861,24 +1084,15 @@ async def get_diagnostic_questions() -> list[dict]:
     10 Paper I, 15 Paper II, 5 Mental Ability."""
     async with aiosqlite.connect(DB_PATH) as db:
         db.row_factory = aiosqlite.Row
-        result = []
-        for section, limit in [("History", 3), ("Geography", 3), ("Polity", 2),
-                                 ("SrSec", 5), ("Grad", 5), ("Pedagogy", 3),
-                                 ("MentalAbility", 5)]:
-            cur = await db.execute(
-                """SELECT * FROM questions
-                   WHERE is_diagnostic=1 AND section=?
-                   ORDER BY q_id LIMIT ?""",
-                (section, limit)
-            )
-            rows = await cur.fetchall()
-            result.extend([dict(r) for r in rows])
-        # Fill up remaining Paper I history if needed
-        if len(result) < 25:
-            cur = await db.execute(
-                """SELECT * FROM questions WHERE is_diagnostic=1
-                   ORDER BY RANDOM() LIMIT ?""",
-                (30,)
-            )
-            result = [dict(r) for r in await cur.fetchall()]
-        return result[:30]
+        # One fetch of the (small) diagnostic pool, bucketed by section in Python
+        rows = [dict(r) for r in await db.execute_fetchall(
+            "SELECT * FROM questions WHERE is_diagnostic=1 ORDER BY section, q_id"
+        )]
+    buckets = {sec: list(grp) for sec, grp in groupby(rows, key=itemgetter('section'))}
+    result = []
+    for section, limit in DIAGNOSTIC_MIX:
+        result.extend(buckets.get(section, [])[:limit])
+    # Fill up remaining Paper I history if needed
+    if len(result) < 25:
+        result = random.sample(rows, min(30, len(rows)))
+    return result[:30]
@@ -13,11 +13,36 @@ from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardBut
 
 from db import (
     get_diagnostic_questions, save_diagnostic_results,
-    mark_user_onboarded, update_topic_accuracy
+    mark_user_onboarded, update_topic_accuracies
 )
 
 # ── In-memory diagnostic state ───────────────────────────────────────────────
-_active_diagnostics: dict[int, dict] = {}   # user_id → state
+class DiagnosticState:
+    """Per-user diagnostic progress (slotted: fixed fields, no per-instance dict)."""
+    __slots__ = (
+        'chat_id', 'questions', 'current', 'correct', 'wrong', 'skipped',
+        'start_time', 'q_start', 'response_times', 'results_by_section',
+        'last_msg_id', 'auto_skip_handle',
+    )
+
+    def __init__(self, chat_id: int, questions: list[dict]) -> None:
+        now = time.time()
+        self.chat_id        = chat_id
+        self.questions      = questions
+        self.current        = 0
+        self.correct        = 0
+        self.wrong          = 0
+        self.skipped        = 0
+        self.start_time     = now
+        self.q_start        = now
+        self.response_times: list[float] = []
+        self.results_by_section: dict[str, dict] = {}   # section → {correct, total, label}
+        self.last_msg_id    = None                      # for cleanup
+        self.auto_skip_handle: asyncio.TimerHandle | None = None
+
+
+_active_diagnostics: dict[int, DiagnosticState] = {}   # user_id → state
+_background_tasks: set[asyncio.Task] = set()           # strong refs for fire-and-forget tasks
 
 QUESTION_TIMEOUT_SEC = 90   # auto-skip after this many seconds
 
@@ -32,6 +57,10 @@ SECTION_LABELS = {
     "MentalAbility":"🧠 Mental Ability",
 }
 
+# Paper-level groupings used for baseline scores
+P1_SECTIONS = frozenset({'History', 'Geography', 'Polity'})
+P2_SECTIONS = frozenset({'SrSec', 'Grad', 'Pedagogy', 'ICT'})
+
 
 def _diag_keyboard(q_index: int, opts: list[str]) -> InlineKeyboardMarkup:
     labels = ["A", "B", "C", "D"]
@@ -62,20 +91,12 @@ async def start_diagnostic(user_id: int, bot: Bot, chat_id: int) -> None:
         await mark_user_onboarded(user_id)
         return
 
-    _active_diagnostics[user_id] = {
-        "chat_id":    chat_id,
-        "questions":  questions,
-        "current":    0,
-        "correct":    0,
-        "wrong":      0,
-        "skipped":    0,
-        "start_time": time.time(),
-        "q_start":    time.time(),
-        "response_times": [],
-        "results_by_section": {},   # section → {correct, total}
-        "last_msg_id": None,        # for cleanup
-        "auto_skip_task": None,
-    }
+    # Resolve display labels once so the per-question path is a plain read
+    for q in questions:
+        sec = q.get('section', '')
+        q['section_label'] = SECTION_LABELS.get(sec, sec)
+
+    _active_diagnostics[user_id] = DiagnosticState(chat_id, questions)
 
     intro = (
         "🎯 *Welcome! Let's assess your baseline — 30 Questions*\n\n"
@@ -97,12 +118,12 @@ async def _send_diagnostic_question(bot: Bot, user_id: int) -> None:
     if not state:
         return
 
-    # Cancel previous auto-skip task
-    if state.get("auto_skip_task") and not state["auto_skip_task"].done():
-        state["auto_skip_task"].cancel()
+    # Cancel previous auto-skip timer
+    if state.auto_skip_handle:
+        state.auto_skip_handle.cancel()
 
-    idx       = state['current']
-    questions = state['questions']
+    idx       = state.current
+    questions = state.questions
 
     if idx >= len(questions):
         await _finish_diagnostic(bot, user_id)
@@ -114,46 +135,49 @@ async def _send_diagnostic_question(bot: Bot, user_id: int) -> None:
     opts_text = "\n".join(
         f"  *{labels[i]})* {o}" for i, o in enumerate(opts) if o
     )
-    section_label = SECTION_LABELS.get(q.get('section', ''), q.get('section', ''))
-
     text = (
-        f"📝 *Diagnostic Q{idx + 1}/30* — {section_label}\n\n"
+        f"📝 *Diagnostic Q{idx + 1}/30* — {q['section_label']}\n\n"
         f"*{q['question']}*\n\n"
         f"{opts_text}\n\n"
         f"⏱️ _{QUESTION_TIMEOUT_SEC}s remaining_"
     )
 
     kb  = _diag_keyboard(idx, opts)
-    msg = await bot.send_message(state['chat_id'], text,
+    msg = await bot.send_message(state.chat_id, text,
                                   parse_mode="Markdown",
                                   reply_markup=kb)
-    state['last_msg_id'] = msg.message_id
-    state['q_start']     = time.time()
+    state.last_msg_id = msg.message_id
+    state.q_start     = time.time()
 
-    # Schedule auto-skip
-    task = asyncio.create_task(
-        _auto_skip_after_timeout(bot, user_id, idx)
+    # Schedule auto-skip: a plain timer, only promoted to a Task if it fires
+    state.auto_skip_handle = asyncio.get_running_loop().call_later(
+        QUESTION_TIMEOUT_SEC, _spawn, _auto_skip_fire, bot, user_id, idx
     )
-    state['auto_skip_task'] = task
 
 
-async def _auto_skip_after_timeout(bot: Bot, user_id: int, q_index: int) -> None:
-    await asyncio.sleep(QUESTION_TIMEOUT_SEC)
+def _spawn(coro_fn, *args) -> None:
+    """Run coro_fn(*args) as a background task, keeping a reference until done."""
+    task = asyncio.create_task(coro_fn(*args))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _auto_skip_fire(bot: Bot, user_id: int, q_index: int) -> None:
     state = _active_diagnostics.get(user_id)
-    if not state or state['current'] != q_index:
+    if not state or state.current != q_index:
         return  # Already answered
-    state['skipped'] += 1
-    state['current'] += 1
+    state.skipped += 1
+    state.current += 1
     try:
         await bot.edit_message_reply_markup(
-            chat_id    = state['chat_id'],
-            message_id = state['last_msg_id'],
+            chat_id    = state.chat_id,
+            message_id = state.last_msg_id,
             reply_markup = None
         )
     except Exception:
         pass
     await bot.send_message(
-        state['chat_id'],
+        state.chat_id,
         f"⏰ *Q{q_index + 1} auto-skipped* (time limit reached)",
         parse_mode="Markdown"
     )
@@ -177,25 +201,27 @@ async def handle_diagnostic_answer(callback: CallbackQuery, bot: Bot) -> None:
         return
 
     q_index = int(q_index_str)
-    if state['current'] != q_index:
+    if state.current != q_index:
         await callback.answer("Already answered!", show_alert=True)
         return
 
     # Cancel auto-skip
-    if state.get("auto_skip_task") and not state["auto_skip_task"].done():
-        state["auto_skip_task"].cancel()
+    if state.auto_skip_handle:
+        state.auto_skip_handle.cancel()
 
-    response_time = time.time() - state['q_start']
-    state['response_times'].append(response_time)
+    response_time = time.time() - state.q_start
+    state.response_times.append(response_time)
 
-    q    = state['questions'][q_index]
+    q    = state.questions[q_index]
     opts = [q.get('opt_a', ''), q.get('opt_b', ''), q.get('opt_c', ''), q.get('opt_d', '')]
     sec  = q.get('section', 'Unknown')
 
     # Track by section
-    if sec not in state['results_by_section']:
-        state['results_by_section'][sec] = {'correct': 0, 'total': 0}
-    state['results_by_section'][sec]['total'] += 1
+    if sec not in state.results_by_section:
+        state.results_by_section[sec] = {
+            'correct': 0, 'total': 0, 'label': q['section_label']
+        }
+    state.results_by_section[sec]['total'] += 1
 
     # Remove keyboard
     try:
@@ -204,18 +230,18 @@ async def handle_diagnostic_answer(callback: CallbackQuery, bot: Bot) -> None:
         pass
 
     if answer_str == "skip":
-        state['skipped'] += 1
+        state.skipped += 1
         feedback = f"⏭️ Skipped Q{q_index + 1}"
     else:
         chosen      = int(answer_str)
         correct_idx = q['answer_idx']
         labels      = ["A", "B", "C", "D"]
         if chosen == correct_idx:
-            state['correct'] += 1
-            state['results_by_section'][sec]['correct'] += 1
+            state.correct += 1
+            state.results_by_section[sec]['correct'] += 1
             feedback = f"✅ Q{q_index + 1}: Correct!"
         else:
-            state['wrong'] += 1
+            state.wrong += 1
             feedback = (
                 f"❌ Q{q_index + 1}: Wrong\n"
                 f"   Correct: *{labels[correct_idx]}) {opts[correct_idx]}*"
@@ -224,9 +250,11 @@ async def handle_diagnostic_answer(callback: CallbackQuery, bot: Bot) -> None:
     await callback.message.reply(feedback, parse_mode="Markdown")
     await callback.answer()
 
-    state['current'] += 1
-    await asyncio.sleep(0.5)
-    await _send_diagnostic_question(bot, user_id)
+    # Release the callback now; the next question follows after a short pause
+    state.current += 1
+    asyncio.get_running_loop().call_later(
+        0.5, _spawn, _send_diagnostic_question, bot, user_id
+    )
 
 
 async def _finish_diagnostic(bot: Bot, user_id: int) -> None:
@@ -235,32 +263,44 @@ async def _finish_diagnostic(bot: Bot, user_id: int) -> None:
     if not state:
         return
 
-    total    = len(state['questions'])
-    correct  = state['correct']
-    wrong    = state['wrong']
-    skipped  = state['skipped']
-    results  = state['results_by_section']
+    total    = len(state.questions)
+    correct  = state.correct
+    wrong    = state.wrong
+    skipped  = state.skipped
+    results  = state.results_by_section
+
+    # Accuracy flag for the breakdown lines
+    def flag(acc: float) -> str:
+        return "✅" if acc >= 0.6 else "⚠️" if acc >= 0.4 else "🔴"
 
-    # Section accuracy
+    # Single pass: section accuracy, breakdown lines, paper totals, weakest
     topic_accuracy = {}
+    section_lines  = []
+    p1_cor = p1_tot = p2_cor = p2_tot = 0
+    min_acc, min_sec = None, None
     for sec, data in results.items():
-        acc = data['correct'] / data['total'] if data['total'] > 0 else 0
+        cor, tot = data['correct'], data['total']
+        acc = cor / tot if tot > 0 else 0
         topic_accuracy[sec] = round(acc, 2)
+        section_lines.append(
+            f"  {flag(acc)} {data['label']}: *{cor}/{tot}* "
+            f"({int(acc*100)}%)\n"
+        )
+        if min_acc is None or acc < min_acc:
+            min_acc, min_sec = acc, sec
+        if sec in P1_SECTIONS:
+            p1_cor += cor
+            p1_tot += tot
+        elif sec in P2_SECTIONS:
+            p2_cor += cor
+            p2_tot += tot
 
     # Paper-level scores
-    p1_secs  = ['History', 'Geography', 'Polity']
-    p2_secs  = ['SrSec', 'Grad', 'Pedagogy', 'ICT']
-
-    def section_score(secs):
-        tot = sum(results[s]['total']   for s in secs if s in results)
-        cor = sum(results[s]['correct'] for s in secs if s in results)
-        return round(cor / tot, 2) if tot > 0 else 0
+    p1_score = round(p1_cor / p1_tot, 2) if p1_tot > 0 else 0
+    p2_score = round(p2_cor / p2_tot, 2) if p2_tot > 0 else 0
 
-    p1_score = section_score(p1_secs)
-    p2_score = section_score(p2_secs)
-
-    avg_rt   = round(sum(state['response_times']) / len(state['response_times']), 1) \
-               if state['response_times'] else 45.0
+    avg_rt   = round(sum(state.response_times) / len(state.response_times), 1) \
+               if state.response_times else 45.0
     skip_rate = round(skipped / total, 2)
 
     recs = await save_diagnostic_results(
@@ -269,44 +309,27 @@ async def _finish_diagnostic(bot: Bot, user_id: int) -> None:
     await mark_user_onboarded(user_id)
 
     # Update per-section accuracy in profile
-    for sec, acc in topic_accuracy.items():
-        await update_topic_accuracy(user_id, sec, acc)
-
-    # Build analysis message
-    def flag(acc: float) -> str:
-        return "✅" if acc >= 0.6 else "⚠️" if acc >= 0.4 else "🔴"
-
-    section_lines = []
-    for sec, data in results.items():
-        acc = data['correct'] / data['total'] if data['total'] > 0 else 0
-        lbl = SECTION_LABELS.get(sec, sec)
-        section_lines.append(
-            f"  {flag(acc)} {lbl}: *{data['correct']}/{data['total']}* "
-            f"({int(acc*100)}%)"
-        )
+    await update_topic_accuracies(user_id, topic_accuracy)
 
     # Weakest section
-    weakest = sorted(
-        [(s, d['correct']/d['total'] if d['total'] > 0 else 0)
-         for s, d in results.items()],
-        key=lambda x: x[1]
-    )
-    weak_sec = SECTION_LABELS.get(weakest[0][0], weakest[0][0]) if weakest else "–"
+    weak_sec = results[min_sec]['label'] if min_sec is not None else "–"
 
     speed_label = "Fast" if avg_rt < 30 else "Normal" if avg_rt < 60 else "Careful/Slow"
     determination = "High" if skip_rate < 0.1 else "Medium" if skip_rate < 0.3 else "Low"
 
-    msg = (
-        f"🎯 *Diagnostic Complete!*\n\n"
-        f"📊 *Baseline Scores*\n"
-        f"  📋 Total: *{correct}/{total}* ({int((correct/total)*100)}%)\n"
+    parts: list[str] = [
+        "🎯 *Diagnostic Complete!*\n\n"
+        "📊 *Baseline Scores*\n",
+        f"  📋 Total: *{correct}/{total}* ({int((correct/total)*100)}%)\n",
         f"  🏛️ Paper I: *{int(p1_score*100)}%* "
-        f"({'strong' if p1_score > 0.6 else '⚠️ needs work'})\n"
+        f"({'strong' if p1_score > 0.6 else '⚠️ needs work'})\n",
         f"  🔬 Paper II: *{int(p2_score*100)}%* "
-        f"({'strong' if p2_score > 0.6 else '⚠️ needs work'})\n\n"
-        f"📈 *Section Breakdown*\n"
-        + "\n".join(section_lines) + "\n\n"
-        f"⚡ *Your Learning Profile*\n"
+        f"({'strong' if p2_score > 0.6 else '⚠️ needs work'})\n\n",
+        "📈 *Section Breakdown*\n",
+    ]
+    parts.extend(section_lines)
+    parts.append(
+        f"\n⚡ *Your Learning Profile*\n"
         f"  ⏱️ Speed: *{avg_rt}s/question* → {speed_label}\n"
         f"  🧠 Style: *{recs['learning_style']}*\n"
         f"  💪 Determination: *{determination}* "
@@ -319,7 +342,8 @@ async def _finish_diagnostic(bot: Bot, user_id: int) -> None:
         f"_Use `/today` to see your personalised study plan!_\n"
         f"_Use `/profile` to view your full capability snapshot._"
     )
-    await bot.send_message(state['chat_id'], msg, parse_mode="Markdown")
+    msg = "".join(parts)
+    await bot.send_message(state.chat_id, msg, parse_mode="Markdown")
 
 
 def has_active_diagnostic(user_id: int) -> bool:
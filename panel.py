@@ -5,31 +5,69 @@ Opens: http://localhost:8888
 
 No extra packages needed — uses only Python built-ins.
 """
+import asyncio
 import subprocess
 import threading
 import time
 import os
 import sys
 import signal
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from collections import deque
 from datetime import datetime
 
 # ── State ─────────────────────────────────────────────────────────────────────
 bot_process: subprocess.Popen | None = None
-log_lines   = deque(maxlen=80)     # last 80 log lines
 start_time: str = "–"
 lock = threading.Lock()
+_loop: asyncio.AbstractEventLoop | None = None   # panel's event loop, once serving
+
+# Log ring buffer: LOG_SLOTS fixed-size slots of pre-rendered HTML rows
+LOG_SLOTS     = 80                 # last 80 log lines
+LOG_SLOT_SIZE = 256                # max bytes per rendered row
+LOG_BUF = bytearray(LOG_SLOTS * LOG_SLOT_SIZE)
+LOG_LEN = [0] * LOG_SLOTS
+log_seq: int = 0                   # total lines ever logged (ring head + cache key)
+
+# Rendered page cache: (monotonic ts, (status, pid, log_seq), encoded body)
+_PAGE_CACHE: tuple[float, tuple, bytes] | None = None
+PAGE_CACHE_TTL = 0.5
+_page_lock = threading.Lock()
 
 BOT_SCRIPT = os.path.join(os.path.dirname(__file__), "bot.py")
 PYTHON     = sys.executable
 PANEL_PORT = 8888
 
 
+def _log_row(ln: str) -> bytes:
+    """Render one log line as an HTML row that fits in a ring-buffer slot."""
+    if "ERROR" in ln or "error" in ln or "Traceback" in ln:
+        head = b'<div class="err">'
+    elif "WARNING" in ln or "WARN" in ln or "warn" in ln:
+        head = b'<div class="warn">'
+    elif "[INFO]" in ln or "OK" in ln or "started" in ln.lower() or "running" in ln.lower():
+        head = b'<div class="inf">'
+    elif ">>>" in ln or "<<<" in ln:
+        head = b'<div class="ok">'
+    else:
+        head = b'<div>'
+    tail = b'</div>\n'
+    body = ln.encode("utf-8")
+    room = LOG_SLOT_SIZE - len(head) - len(tail)
+    if len(body) > room:
+        # Trim on a UTF-8 character boundary
+        body = body[:room].decode("utf-8", "ignore").encode("utf-8")
+    return head + body + tail
+
+
 def add_log(line: str) -> None:
-    ts = datetime.now().strftime("%H:%M:%S")
+    global log_seq
+    ts  = datetime.now().strftime("%H:%M:%S")
+    row = _log_row(f"[{ts}] {line}")
     with lock:
-        log_lines.append(f"[{ts}] {line}")
+        slot = log_seq % LOG_SLOTS
+        off  = slot * LOG_SLOT_SIZE
+        LOG_BUF[off:off + len(row)] = row
+        LOG_LEN[slot] = len(row)
+        log_seq += 1
 
 
 def start_bot() -> None:
@@ -75,13 +113,21 @@ def restart_bot() -> None:
 
 
 def _read_output() -> None:
-    """Stream subprocess output into log_lines."""
+    """Stream subprocess output into the log ring buffer."""
     if not bot_process:
         return
     for line in bot_process.stdout:
-        add_log(line.rstrip())
+        _log_threadsafe(line.rstrip())
     ret = bot_process.wait()
-    add_log(f"<<< Bot process exited (code {ret})")
+    _log_threadsafe(f"<<< Bot process exited (code {ret})")
+
+
+def _log_threadsafe(line: str) -> None:
+    """Hand a log line from the reader thread to the event loop, if running."""
+    if _loop is not None and _loop.is_running():
+        _loop.call_soon_threadsafe(add_log, line)
+    else:
+        add_log(line)
 
 
 def _bot_status() -> tuple[str, str]:
@@ -215,77 +261,130 @@ Adaptive Intelligence v2</footer>
 </body>
 </html>"""
 
+# Log rows are already encoded bytes, so the template is split around them
+_PAGE_HEAD, _PAGE_TAIL = HTML_TEMPLATE.split("{log_html}")
+_PAGE_TAIL = _PAGE_TAIL.format().encode("utf-8")
 
-def _make_log_html() -> str:
-    with lock:
-        lines = list(log_lines)
-    rows = []
-    for ln in lines:
-        if "ERROR" in ln or "error" in ln or "Traceback" in ln:
-            rows.append(f'<div class="err">{ln}</div>')
-        elif "WARNING" in ln or "WARN" in ln or "warn" in ln:
-            rows.append(f'<div class="warn">{ln}</div>')
-        elif "[INFO]" in ln or "OK" in ln or "started" in ln.lower() or "running" in ln.lower():
-            rows.append(f'<div class="inf">{ln}</div>')
-        elif ">>>" in ln or "<<<" in ln:
-            rows.append(f'<div class="ok">{ln}</div>')
-        else:
-            rows.append(f'<div>{ln}</div>')
-    return "\n".join(rows) if rows else '<div class="inf">-- No log output yet --</div>'
 
-
-def _make_page() -> str:
+def _make_log_html() -> bytes:
+    """Concatenate the ring-buffer rows, oldest first."""
+    with lock:
+        n = min(log_seq, LOG_SLOTS)
+        if not n:
+            return b'<div class="inf">-- No log output yet --</div>'
+        first = log_seq - n
+        view  = memoryview(LOG_BUF)
+        parts = []
+        for i in range(first, log_seq):
+            slot = i % LOG_SLOTS
+            off  = slot * LOG_SLOT_SIZE
+            parts.append(view[off:off + LOG_LEN[slot]])
+        return b"".join(parts)
+
+
+def _make_page() -> bytes:
     status, cls    = _bot_status()
     pid            = bot_process.pid if (bot_process and bot_process.poll() is None) else "–"
     uptime_str     = "–"
 
-    return HTML_TEMPLATE.format(
+    head = _PAGE_HEAD.format(
         status  = status,
         cls     = cls,
         pid     = pid,
         started = start_time,
         uptime  = uptime_str,
-        log_html= _make_log_html(),
     )
+    return head.encode("utf-8") + _make_log_html() + _PAGE_TAIL
+
+
+def _cached_page() -> bytes:
+    """Return the encoded page, re-rendering at most once per PAGE_CACHE_TTL."""
+    global _PAGE_CACHE
+    status, _ = _bot_status()
+    pid = bot_process.pid if (bot_process and bot_process.poll() is None) else "–"
+    key = (status, pid, log_seq)
+    with _page_lock:
+        now = time.monotonic()
+        if _PAGE_CACHE and now - _PAGE_CACHE[0] < PAGE_CACHE_TTL and _PAGE_CACHE[1] == key:
+            return _PAGE_CACHE[2]
+        body = _make_page()
+        _PAGE_CACHE = (now, key, body)
+        return body
+
 
+def _invalidate_page() -> None:
+    global _PAGE_CACHE
+    with _page_lock:
+        _PAGE_CACHE = None
 
-# ── HTTP Handler ──────────────────────────────────────────────────────────────
-class Handler(BaseHTTPRequestHandler):
-    def log_message(self, *args):   # silence access log spam
+
+# ── HTTP Server (asyncio) ─────────────────────────────────────────────────────
+_REASONS = {200: "OK", 303: "See Other", 400: "Bad Request", 501: "Not Implemented"}
+_ACTIONS = {"/start": start_bot, "/stop": stop_bot, "/restart": restart_bot}
+
+
+def _log_action_failure(fut: asyncio.Future) -> None:
+    """Done-callback for a panel action: surface its error in the panel log."""
+    if not fut.cancelled() and fut.exception() is not None:
+        add_log(f"!!! Action failed: {fut.exception()!r}")
+
+
+def _response(code: int, body: bytes = b"", headers: dict | None = None) -> bytes:
+    head = [f"HTTP/1.1 {code} {_REASONS.get(code, '')}"]
+    for k, v in (headers or {}).items():
+        head.append(f"{k}: {v}")
+    head.append(f"Content-Length: {len(body)}")
+    head.append("Connection: close")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def _handle_client(reader: asyncio.StreamReader,
+                         writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if len(request_line) < 2:
+            writer.write(_response(400))
+        elif request_line[0] == "GET":
+            writer.write(_response(200, _cached_page(),
+                                   {"Content-Type": "text/html; charset=utf-8"}))
+        elif request_line[0] == "POST":
+            length = int(headers.get("content-length", 0) or 0)
+            if length:
+                await reader.readexactly(length)
+            action = _ACTIONS.get(request_line[1].rstrip("/"))
+            if action:
+                # start/stop block on the subprocess — keep them off the loop
+                fut = asyncio.get_running_loop().run_in_executor(None, action)
+                fut.add_done_callback(_log_action_failure)
+            _invalidate_page()
+            # Redirect back to GET
+            writer.write(_response(303, headers={"Location": "/"}))
+        else:
+            writer.write(_response(501))
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
         pass
+    finally:
+        writer.close()
 
-    def _respond(self, body: str, code: int = 200) -> None:
-        enc = body.encode("utf-8")
-        self.send_response(code)
-        self.send_header("Content-Type", "text/html; charset=utf-8")
-        self.send_header("Content-Length", str(len(enc)))
-        self.end_headers()
-        self.wfile.write(enc)
-
-    def do_GET(self):
-        self._respond(_make_page())
-
-    def do_POST(self):
-        path = self.path.rstrip("/")
-        if path == "/start":
-            threading.Thread(target=start_bot, daemon=True).start()
-        elif path == "/stop":
-            threading.Thread(target=stop_bot, daemon=True).start()
-        elif path == "/restart":
-            threading.Thread(target=restart_bot, daemon=True).start()
-        # Redirect back to GET
-        self.send_response(303)
-        self.send_header("Location", "/")
-        self.end_headers()
 
+async def _serve() -> None:
+    global _loop
+    _loop = asyncio.get_running_loop()
+    server = await asyncio.start_server(_handle_client, "0.0.0.0", PANEL_PORT)
 
-# ── Main ──────────────────────────────────────────────────────────────────────
-def main() -> None:
     add_log("Panel started — auto-launching bot...")
     start_bot()
 
-    server = HTTPServer(("0.0.0.0", PANEL_PORT), Handler)
-    url    = f"http://localhost:{PANEL_PORT}"
+    url = f"http://localhost:{PANEL_PORT}"
     print(f"\n{'='*50}")
     print(f"  RPSC Study Bot — Control Panel")
     print(f"  Open in browser: {url}")
@@ -299,8 +398,14 @@ def main() -> None:
     except Exception:
         pass
 
+    async with server:
+        await server.serve_forever()
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main() -> None:
     try:
-        server.serve_forever()
+        asyncio.run(_serve())
     except KeyboardInterrupt:
         print("\nShutting down...")
         stop_bot()
@@ -4,17 +4,32 @@ Uses dynamic priority formula:
   topic_priority = (1 - accuracy) * pyq_weight * completion_pressure * streak_multiplier
 65% Paper-II focus by default; adjusts based on diagnostic profile.
 """
+import asyncio
+import functools
+import logging
 import random
-import math
-from datetime import date
+from bisect import bisect
+from collections import namedtuple
+from itertools import accumulate
+import numpy as np
 from db import (
-    get_all_topics, save_daily_plan, get_today_plan,
-    get_user_profile, get_streak, get_user
+    Topic, get_cached_topics, save_daily_plan, get_next_pending_plan_block,
+    get_user_profile, get_streak, get_user,
+    compute_weak_topics, get_calibration_history
 )
-from config import DAILY_BLOCKS, TIMEZONE
-from datetime import datetime, date, timedelta
-import pytz
+from config import DAILY_BLOCKS
+from datetime import datetime, date, timedelta, time as dt_time
 
+__all__ = [
+    "SECTION_EMOJIS",
+    "generate_daily_plan", "generate_plans_bulk",
+    "format_plan_message", "format_block_message", "format_profile_message",
+    "get_next_pending_block", "get_exam_countdown",
+]
+
+# DAILY_BLOCKS as immutable records, converted once at import
+BlockDef = namedtuple('BlockDef', 'label paper section hours emoji')
+_DAILY_BLOCKS = tuple(BlockDef(**b) for b in DAILY_BLOCKS)
 
 SECTION_EMOJIS = {
     "SrSec":    "🔬",
@@ -28,42 +43,112 @@ SECTION_EMOJIS = {
     "Review":   "📝",
 }
 
+_STATUS_ICONS = {"done": "✅", "skipped": "⏭️", "pending": "⏳"}
+
+
+_background_tasks: set[asyncio.Task] = set()   # strong refs for fire-and-forget saves
+
+
+async def _save_plan_quietly(user_id: int, blocks: list[dict]) -> None:
+    try:
+        await save_daily_plan(user_id, blocks)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Background plan save failed for {user_id}: {e}")
+
+
+async def _persist_plan(user_id: int, blocks: list[dict], background: bool) -> None:
+    """Save the plan, or schedule the save when the caller only renders it."""
+    if not background:
+        await save_daily_plan(user_id, blocks)
+        return
+    task = asyncio.create_task(_save_plan_quietly(user_id, blocks))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_hhmm(s: str) -> dt_time:
+    """'HH:MM' → datetime.time; routine times repeat across users, so memoise."""
+    return datetime.strptime(s, "%H:%M").time()
+
 
-async def _compute_topic_priority(
-        topic: dict,
+def _priority_kernel(
+        raw_acc: np.ndarray,
+        pyq_w: np.ndarray,
+        marks_w: np.ndarray,
+        streak_mult: float,
+) -> np.ndarray:
+    # Accuracy penalty: low accuracy → higher priority (50% if unknown)
+    acc = np.clip(raw_acc, 0.01, 1.0)
+
+    # Completion pressure: lower progress → higher urgency
+    pressure = np.maximum(0.1, 1.0 - raw_acc)
+
+    return (1.0 - acc) * pyq_w * pressure * streak_mult * marks_w
+
+
+# JIT the kernel when numba is installed (large topic catalogues); the plain
+# NumPy version above is the fallback.
+try:
+    from numba import njit
+except ImportError:
+    _NUMBA_AVAILABLE = False
+else:
+    try:
+        _jit_kernel = njit(cache=True, fastmath=True)(_priority_kernel)
+        _jit_kernel(np.ones(1), np.ones(1), np.ones(1), 1.0)   # compile at import
+        _priority_kernel = _jit_kernel
+        _NUMBA_AVAILABLE = True
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"numba compile failed, using NumPy kernel: {e}")
+        _NUMBA_AVAILABLE = False
+
+
+def _topic_priorities(
+        topics: list[Topic],
         topic_accuracy: dict,
         streak: int,
-        completion_ratio: float,
-) -> float:
+) -> np.ndarray:
     """
-    Dynamic priority score for a topic.
+    Dynamic priority score for every topic, in one vectorised pass.
     Higher = should be studied more urgently.
     """
-    section   = topic['section']
-    pyq_w     = topic.get('pyq_weight', 1) or 1
-    marks_w   = topic.get('marks_weight', 1) or 1
-
-    # Accuracy penalty: low accuracy → higher priority
-    acc  = topic_accuracy.get(section, 0.5)   # default 50% if unknown
-    acc  = max(0.01, min(1.0, acc))
-
-    # Completion pressure: lower progress → higher urgency
-    pressure = max(0.1, 1.0 - completion_ratio)
+    n       = len(topics)
+    pyq_w   = np.fromiter(((t.pyq_weight or 1) for t in topics), float, n)
+    marks_w = np.fromiter(((t.marks_weight or 1) for t in topics), float, n)
+    raw_acc = np.fromiter((topic_accuracy.get(t.section, 0.5) for t in topics), float, n)
 
     # Streak multiplier: longer streak → slight chill, shorter → urgency
     streak_mult = 1.0 + (0.1 * max(0, 5 - streak))   # up to 1.5 for streak=0
 
-    priority_score = (1.0 - acc) * pyq_w * pressure * streak_mult * marks_w
-    return round(priority_score, 3)
+    return np.round(_priority_kernel(raw_acc, pyq_w, marks_w, streak_mult), 3)
 
-async def generate_daily_plan(user_id: int) -> list[dict]:
+async def generate_daily_plan(
+        user_id: int,
+        background_save: bool = False,
+        topics: tuple[list[Topic], list[Topic]] | None = None,
+) -> list[dict]:
     """
     Generate a personalised daily study plan.
     Adapts block hours to the user's profile (from diagnostic).
+    Pass background_save=True only from bulk/scheduled runs; an interactive
+    caller must wait for the save, as the user's next tap reads the plan
+    back from the DB.
+    `topics` is an already-fetched (Paper II, Paper I) pair, as passed by
+    generate_plans_bulk.
     """
     # Build timeline starting from the Wake-up time and inserts breaks for Lunch, Dinner, and Snacks.
-    profile = await get_user_profile(user_id)
-    streak  = await get_streak(user_id)
+    # The lookups are independent — overlap their round-trips
+    lookups = [get_user_profile(user_id), get_streak(user_id), get_user(user_id)]
+    if topics is None:
+        lookups += [get_cached_topics(2), get_cached_topics(1)]
+    # A failed lookup must abort rather than save a plan built from defaults
+    results = await asyncio.gather(*lookups)
+    profile, streak, user_data = results[:3]
+    if topics is None:
+        topics_p2, topics_p1 = results[3:]
+    else:
+        topics_p2, topics_p1 = topics
 
     topic_accuracy    = profile.get('topic_accuracy', {}) if profile else {}
     daily_hours       = profile.get('recommended_daily_hours', 10.5) if profile else 10.5
@@ -75,7 +160,6 @@ async def generate_daily_plan(user_id: int) -> list[dict]:
     snack   = profile.get('snack_time', '17:00')   if profile else '17:00'
 
     # Check for Rest Day (every 14 days)
-    user_data = await get_user(user_id)
     if user_data:
         try:
             # created_at is usually like '2026-02-22' or '2026-02-22 06:30:34'
@@ -83,65 +167,70 @@ async def generate_daily_plan(user_id: int) -> list[dict]:
             created = datetime.strptime(created_str, "%Y-%m-%d")
             days_since = (datetime.now() - created).days
             if days_since > 0 and days_since % 14 == 0:
-                return await _generate_rest_day_plan(user_id)
+                return await _generate_rest_day_plan(user_id, background_save)
         except Exception as e:
-            import logging
             logging.getLogger(__name__).error(f"Rest day check error: {e}")
 
-    topics_p2 = await get_all_topics(paper=2)
-    topics_p1 = await get_all_topics(paper=1)
+    # Dynamic priorities live in parallel lists — the cached, shared Topic rows
+    # are frozen
+    pri_p2 = _topic_priorities(topics_p2, topic_accuracy, streak).tolist()
+    pri_p1 = _topic_priorities(topics_p1, topic_accuracy, streak).tolist()
 
-    # Add dynamic priority to each topic
-    for t in topics_p2 + topics_p1:
-        comp_ratio = topic_accuracy.get(t['section'], 0.5)
-        t['_dyn_priority'] = await _compute_topic_priority(
-            t, topic_accuracy, streak, comp_ratio
-        )
+    def weighted_pool(pool: list, pri: list) -> tuple[list, list, list]:
+        cum = list(accumulate(max(0.01, p) for p in pri))
+        return pool, pri, cum
 
-    def adaptive_pick(pool: list) -> dict | None:
+    def adaptive_pick(pool: list, pri: list, cum: list) -> tuple[Topic | None, float]:
+        # Same draw as random.choices(cum_weights=cum), minus the per-call rebuild
         if not pool:
-            return None
-        weights = [max(0.01, t.get('_dyn_priority', 1.0)) for t in pool]
-        return random.choices(pool, weights=weights, k=1)[0]
+            return None, 0
+        i = bisect(cum, random.random() * cum[-1], 0, len(pool) - 1)
+        return pool[i], pri[i]
+
+    p2_by_section = {}
+    for t, p in zip(topics_p2, pri_p2):
+        sec_topics, sec_pri = p2_by_section.setdefault(t.section, ([], []))
+        sec_topics.append(t)
+        sec_pri.append(p)
+
+    p1_pool   = weighted_pool(topics_p1, pri_p1)
+    sec_pools = {}   # section -> (pool, priorities, cumulative weights), built on first use
 
     # Scale block hours proportionally to recommended daily hours
     hour_scale = daily_hours / 10.5
 
-    # Build timeline
-    current_time_dt = datetime.combine(date.today(), datetime.strptime(wake_up, "%H:%M").time())
-    
+    # Build timeline (break times are loop-invariant — parse them once)
+    today           = date.today()
+    current_time_dt = datetime.combine(today, _parse_hhmm(wake_up))
+    lunch_dt        = datetime.combine(today, _parse_hhmm(lunch))
+    snack_dt        = datetime.combine(today, _parse_hhmm(snack))
+    dinner_dt       = datetime.combine(today, _parse_hhmm(dinner))
+    breaks          = sorted([(lunch_dt, 45), (snack_dt, 20), (dinner_dt, 45)])   # (start, minutes)
+
     blocks = []
-    for block_def in DAILY_BLOCKS:
-        section = block_def['section']
-        paper   = block_def['paper']
-        adj_hrs = round(block_def['hours'] * hour_scale, 1)
-        
-        # Check for breaks
-        lunch_dt  = datetime.combine(date.today(), datetime.strptime(lunch, "%H:%M").time())
-        snack_dt  = datetime.combine(date.today(), datetime.strptime(snack, "%H:%M").time())
-        dinner_dt = datetime.combine(date.today(), datetime.strptime(dinner, "%H:%M").time())
-
-        # If block overlaps with lunch, move it after lunch
-        if current_time_dt < lunch_dt and (current_time_dt + timedelta(hours=adj_hrs)) > lunch_dt:
-            current_time_dt = lunch_dt + timedelta(minutes=45) # 45 min break
-        
-        # If block overlaps with snack, move it
-        if current_time_dt < snack_dt and (current_time_dt + timedelta(hours=adj_hrs)) > snack_dt:
-            current_time_dt = snack_dt + timedelta(minutes=20) # 20 min break
-
-        # If block overlaps with dinner, move it
-        if current_time_dt < dinner_dt and (current_time_dt + timedelta(hours=adj_hrs)) > dinner_dt:
-            current_time_dt = dinner_dt + timedelta(minutes=45) # 45 min break
+    for block_def in _DAILY_BLOCKS:
+        section = block_def.section
+        paper   = block_def.paper
+        adj_hrs = round(block_def.hours * hour_scale, 1)
+        block_len = timedelta(hours=adj_hrs)
+
+        # If block overlaps a break, move it after the break (earliest first)
+        for break_dt, break_min in breaks:
+            if current_time_dt < break_dt < current_time_dt + block_len:
+                current_time_dt = break_dt + timedelta(minutes=break_min)
 
         start_time_str = current_time_dt.strftime("%I:%M %p")
 
         if paper == 2:
-            sec_pool = [t for t in topics_p2 if t['section'] == section] or topics_p2
-            topic    = adaptive_pick(sec_pool)
+            if section not in sec_pools:
+                sec_pools[section] = weighted_pool(
+                    *p2_by_section.get(section, (topics_p2, pri_p2))
+                )
+            topic, priority = adaptive_pick(*sec_pools[section])
         elif paper == 1:
-            topic = adaptive_pick(topics_p1)
+            topic, priority = adaptive_pick(*p1_pool)
         else:
-            topic = None
+            topic, priority = None, 0
 
         method_hint = ""
         if topic and error_type == "conceptual":
@@ -150,26 +239,47 @@ async def generate_daily_plan(user_id: int) -> list[dict]:
             method_hint = " [MCQ→Review]"
 
         block = {
-            "label":             f"{start_time_str}: {block_def['label']}{method_hint}",
+            "label":             f"{start_time_str}: {block_def.label}{method_hint}",
             "section":           section,
             "paper":             paper,
             "hours":             adj_hrs,
-            "emoji":             block_def['emoji'],
-            "topic_id":          topic['topic_id']         if topic else None,
-            "topic_name":        topic['name']              if topic else "–",
-            "free_pdf_link":     topic['free_pdf_link']     if topic else "",
-            "recommended_books": topic['recommended_books'] if topic else "",
-            "marks_weight":      topic['marks_weight']      if topic else 0,
-            "dyn_priority":      topic.get('_dyn_priority', 0) if topic else 0,
+            "emoji":             block_def.emoji,
+            "topic_id":          topic.topic_id          if topic else None,
+            "topic_name":        topic.name              if topic else "–",
+            "free_pdf_link":     topic.free_pdf_link     if topic else "",
+            "recommended_books": topic.recommended_books if topic else "",
+            "marks_weight":      topic.marks_weight      if topic else 0,
+            "dyn_priority":      priority,
         }
         blocks.append(block)
-        current_time_dt += timedelta(hours=adj_hrs)
+        current_time_dt += block_len
 
-    await save_daily_plan(user_id, blocks)
+    await _persist_plan(user_id, blocks, background_save)
     return blocks
 
 
-async def _generate_rest_day_plan(user_id: int) -> list[dict]:
+async def generate_plans_bulk(
+        user_ids: list[int],
+        concurrency: int = 32,
+        background_save: bool = False,
+) -> list[list[dict] | Exception]:
+    """
+    Generate today's plan for many users at once (scheduled jobs).
+    Topics are fetched once for the whole batch; at most `concurrency` plans
+    are in flight. Results are in user_ids order — a failed user's slot holds
+    the exception instead of aborting the batch.
+    """
+    topics = tuple(await asyncio.gather(get_cached_topics(2), get_cached_topics(1)))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(uid: int) -> list[dict]:
+        async with sem:
+            return await generate_daily_plan(uid, background_save, topics)
+
+    return await asyncio.gather(*(one(u) for u in user_ids), return_exceptions=True)
+
+
+async def _generate_rest_day_plan(user_id: int, background_save: bool = False) -> list[dict]:
     """Light plan for the fortnightly rest day."""
     blocks = [
         {
@@ -191,94 +301,101 @@ async def _generate_rest_day_plan(user_id: int) -> list[dict]:
             "topic_name": "Just flip through your notes."
         }
     ]
-    await save_daily_plan(user_id, blocks)
+    await _persist_plan(user_id, blocks, background_save)
     return blocks
 
 
 async def format_plan_message(blocks: list[dict], daily_hours: float = 10.5) -> str:
     today_str = date.today().strftime("%A, %d %B %Y")
-    lines = [
-        f"📅 *Study Plan — {today_str}*",
-        f"⏱️ Total: *{daily_hours}h* | 📊 65% Paper-II | Adaptive Priority\n"
+    parts = [
+        f"📅 *Study Plan — {today_str}*\n"
+        f"⏱️ Total: *{daily_hours}h* | 📊 65% Paper-II | Adaptive Priority\n\n"
     ]
 
     for i, b in enumerate(blocks, 1):
-        status_icon = {"done": "✅", "skipped": "⏭️", "pending": "⏳"}.get(
-            b.get('status', 'pending'), "⏳"
-        )
+        status_icon = _STATUS_ICONS.get(b.get('status', 'pending'), "⏳")
         emoji = SECTION_EMOJIS.get(b['section'], b.get('emoji', '📌'))
-        lines.append(f"*Block {i}* {status_icon} {emoji} `{b['label']}`")
-        lines.append(f"  ⏱️ {b['hours']}h | 🎯 {b.get('marks_weight', '')} marks")
+        parts.append(
+            f"*Block {i}* {status_icon} {emoji} `{b['label']}`\n"
+            f"  ⏱️ {b['hours']}h | 🎯 {b.get('marks_weight', '')} marks\n"
+        )
 
         if b.get('topic_name') and b['topic_name'] != '–':
             pri_arrow = "🔺" if b.get('dyn_priority', 0) > 5 else ""
-            lines.append(f"  📚 *{b['topic_name']}* {pri_arrow}")
+            parts.append(f"  📚 *{b['topic_name']}* {pri_arrow}\n")
 
         if b.get('recommended_books'):
-            lines.append(f"  📖 {b['recommended_books']}")
+            parts.append(f"  📖 {b['recommended_books']}\n")
 
         if b.get('free_pdf_link'):
-            lines.append(f"  🔗 [Open Free PDF]({b['free_pdf_link']})")
+            parts.append(f"  🔗 [Open Free PDF]({b['free_pdf_link']})\n")
 
-        lines.append("")
+        parts.append("\n")
 
-    lines.append(f"🔥 *Stay focused! {daily_hours}h of disciplined study = RPSC Selection!*")
-    return "\n".join(lines)
+    parts.append(f"🔥 *Stay focused! {daily_hours}h of disciplined study = RPSC Selection!*")
+    return "".join(parts)
 
 
 async def get_next_pending_block(user_id: int) -> dict | None:
-    blocks = await get_today_plan(user_id)
-    for b in blocks:
-        if b.get('status') == 'pending':
-            return b
-    return None
+    return await get_next_pending_plan_block(user_id)
 
 
 async def format_block_message(block: dict, block_num: int) -> str:
     emoji = SECTION_EMOJIS.get(block.get('section', ''), "📌")
-    lines = [
-        f"🚀 *Next Block — #{block_num}*",
-        f"{emoji} *{block.get('label', 'Study Block')}*",
-        f"",
-        f"⏱️ Duration: *{block.get('hours', 1)}h*",
+    parts = [
+        f"🚀 *Next Block — #{block_num}*\n"
+        f"{emoji} *{block.get('label', 'Study Block')}*\n"
+        f"\n"
+        f"⏱️ Duration: *{block.get('hours', 1)}h*\n"
     ]
     if block.get('topic_name') and block['topic_name'] != '–':
-        lines.append(f"📚 Topic: *{block['topic_name']}*")
+        parts.append(f"📚 Topic: *{block['topic_name']}*\n")
     if block.get('marks_weight'):
-        lines.append(f"🎯 Marks Weight: *{block['marks_weight']}*")
+        parts.append(f"🎯 Marks Weight: *{block['marks_weight']}*\n")
     if block.get('recommended_books'):
-        lines.append(f"📖 Book: {block['recommended_books']}")
+        parts.append(f"📖 Book: {block['recommended_books']}\n")
     if block.get('free_pdf_link'):
-        lines.append(f"🔗 [Open NCERT PDF]({block['free_pdf_link']})")
-    lines += [
-        "",
-        "💪 *Start now. Every minute counts for RPSC!*",
+        parts.append(f"🔗 [Open NCERT PDF]({block['free_pdf_link']})\n")
+    parts.append(
+        "\n"
+        "💪 *Start now. Every minute counts for RPSC!*\n"
         "Use `/done <minutes> <score>` when finished."
-    ]
-    return "\n".join(lines)
+    )
+    return "".join(parts)
+
+
+_COUNTDOWN_CACHE: tuple[date, str] | None = None   # (day computed, message)
 
 
 async def get_exam_countdown() -> str:
+    global _COUNTDOWN_CACHE
+    today = date.today()
+    if _COUNTDOWN_CACHE and _COUNTDOWN_CACHE[0] == today:
+        return _COUNTDOWN_CACHE[1]
+
     exam_date = date(2025, 12, 1)
-    today     = date.today()
     delta     = exam_date - today
     if delta.days < 0:
-        return "🎓 Exam date has passed. Review your performance!"
-    weeks, days = divmod(delta.days, 7)
-    return f"🗓️ *Exam Countdown:* {delta.days} days ({weeks}w {days}d) remaining!"
+        msg = "🎓 Exam date has passed. Review your performance!"
+    else:
+        weeks, days = divmod(delta.days, 7)
+        msg = f"🗓️ *Exam Countdown:* {delta.days} days ({weeks}w {days}d) remaining!"
+    _COUNTDOWN_CACHE = (today, msg)
+    return msg
 
 
 async def format_profile_message(user_id: int) -> str:
     """Format the /profile snapshot."""
-    from db import compute_weak_topics, get_calibration_history
-    profile  = await get_user_profile(user_id)
-    streak   = await get_streak(user_id)
-    weak     = await compute_weak_topics(user_id)
-    cal_hist = await get_calibration_history(user_id, days=3)
-
+    profile = await get_user_profile(user_id)
     if not profile:
         return "❌ No profile found. Complete the diagnostic test first with /start"
 
+    streak, weak, cal_hist = await asyncio.gather(
+        get_streak(user_id),
+        compute_weak_topics(user_id),
+        get_calibration_history(user_id, days=3),
+    )
+
     ta = profile.get('topic_accuracy', {})
 
     section_lines = []
@@ -2,30 +2,138 @@
 questions.py - MCQ engine with 1/3 negative marking for mock tests.
 """
 import asyncio
+import functools
+import logging
 import time
+import uuid
+from collections import namedtuple
 from typing import Callable
 from aiogram import Bot
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, PollAnswer
 from db import get_questions, save_mock, get_mock_history
+from send_queue import send
 from config import NEGATIVE_MARKING_RATIO, MOCK_TIME_LIMITS
 
+log = logging.getLogger(__name__)
+
 # ── In-memory mock state ────────────────────────────────────────────────────
 _active_mocks: dict[int, dict] = {}   # user_id → mock state
+_background_tasks: set[asyncio.Task] = set()   # strong refs for fire-and-forget sends
+_poll_owner: dict[str, tuple[int, str, int]] = {}   # poll_id → (user_id, mock_id, q_index)
+
+MOCK_IDLE_TTL = 4 * 3600   # seconds without an answer before a mock is dropped
+
+
+def _get_mock(user_id: int) -> dict | None:
+    """Live mock state for user_id, evicting it if it has sat idle too long."""
+    state = _active_mocks.get(user_id)
+    if state is None:
+        return None
+    if time.time() - state['last_active'] > MOCK_IDLE_TTL:
+        _drop_mock(user_id)
+        return None
+    return state
+
+
+def sweep_idle_mocks() -> int:
+    """Drop every mock idle past MOCK_IDLE_TTL; returns how many were dropped."""
+    cutoff = time.time() - MOCK_IDLE_TTL
+    stale = [uid for uid, s in _active_mocks.items() if s['last_active'] < cutoff]
+    for uid in stale:
+        _drop_mock(uid)
+    return len(stale)
+
+
+def _drop_mock(user_id: int) -> dict | None:
+    """Remove a mock and forget any of its polls still awaiting an answer."""
+    state = _active_mocks.pop(user_id, None)
+    if state:
+        for poll_id in state['poll_ids']:
+            _poll_owner.pop(poll_id, None)
+    return state
+
+
+def _set_bit(ba: bytearray, i: int) -> None:
+    ba[i >> 3] |= 1 << (i & 7)
+
+
+def _get_bit(ba: bytearray, i: int) -> bool:
+    return bool(ba[i >> 3] & (1 << (i & 7)))
+
+
+def _popcount(ba: bytearray) -> int:
+    return int.from_bytes(ba, 'big').bit_count()
+
+
+LABELS = ("A", "B", "C", "D")
+
+FEEDBACK_CORRECT = "✅ *Correct! +1 mark*\n📖 _{}_".format
+FEEDBACK_WRONG = (
+    f"❌ *Wrong! -{NEGATIVE_MARKING_RATIO:.2f} mark*\n"
+    "Your answer: *{}) {}*\n"
+    "✅ Correct: *{}) {}*\n"
+    "💡 _{}_"
+).format
+FEEDBACK_SKIPPED = "⏭️ *Q{} Skipped*\n✅ Correct: *{}*".format
+
+# Telegram quiz poll limits
+POLL_QUESTION_MAX    = 300
+POLL_OPTION_MAX      = 100
+POLL_EXPLANATION_MAX = 200
+
+# Everything a question needs at answer time, derived once at mock start.
+# poll_opts is None when the question doesn't fit a quiz poll and has to go
+# out as a message with answer buttons instead.
+PackedQ = namedtuple('PackedQ', 'question body opts answer_idx explanation keyboard poll_opts')
+
+
+def _pack_question(q: dict, idx: int, mock_id: str) -> PackedQ:
+    opts = (q['opt_a'], q['opt_b'], q['opt_c'], q['opt_d'])
+    present = [o for o in opts if o]
+    opts_text = "\n".join(f"  *{LABELS[i]})* {o}" for i, o in enumerate(opts) if o)
+    body = (
+        f"{q['question']}\n\n"
+        f"{opts_text}\n\n"
+        f"_Level: {q.get('level', '?').title()} | "
+        f"Paper {q.get('paper', '?')}_"
+    )
+    fits_poll = (
+        len(q['question']) + 12 <= POLL_QUESTION_MAX   # room for the "Q10/10. " prefix
+        # all four present, so poll option ids line up with answer_idx
+        and len(present) == len(opts)
+        and all(len(o) <= POLL_OPTION_MAX for o in present)
+    )
+    if fits_poll:
+        # Poll carries the options itself; the keyboard only needs Skip / End
+        keyboard  = _make_option_keyboard(idx, [], mock_id)
+        poll_opts = tuple(present)
+    else:
+        keyboard  = _make_option_keyboard(idx, present, mock_id)
+        poll_opts = None
+    return PackedQ(q['question'], body, opts, q['answer_idx'], q.get('explanation') or '',
+                   keyboard, poll_opts)
+
+
+@functools.lru_cache(maxsize=2048)
+def _button_template(q_index: int, n_opts: int) -> tuple[tuple[str, str], ...]:
+    """(label prefix, callback_data tail) per button; the same for every mock."""
+    return tuple((f"{LABELS[i]}) ", f":{q_index}:{i}") for i in range(n_opts)) + (
+        ("⏭️ Skip", f":{q_index}:skip"),
+        ("🛑 End Mock", f":{q_index}:end"),
+    )
 
 
 def _make_option_keyboard(q_index: int, options: list[str], mock_id: str) -> InlineKeyboardMarkup:
-    labels = ["A", "B", "C", "D"]
-    buttons = []
-    for i, opt in enumerate(options):
-        buttons.append([
-            InlineKeyboardButton(
-                text=f"{labels[i]}) {opt}",
-                callback_data=f"mock:{mock_id}:{q_index}:{i}"
-            )
-        ])
+    *opt_tpl, (skip_text, skip_tail), (end_text, end_tail) = _button_template(q_index, len(options))
+    prefix  = f"mock:{mock_id}"
+    buttons = [
+        [InlineKeyboardButton(text=label + opt, callback_data=prefix + tail)]
+        for (label, tail), opt in zip(opt_tpl, options)
+    ]
     buttons.append([
-        InlineKeyboardButton(text="⏭️ Skip", callback_data=f"mock:{mock_id}:{q_index}:skip"),
-        InlineKeyboardButton(text="🛑 End Mock", callback_data=f"mock:{mock_id}:{q_index}:end"),
+        InlineKeyboardButton(text=skip_text, callback_data=prefix + skip_tail),
+        InlineKeyboardButton(text=end_text, callback_data=prefix + end_tail),
     ])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
@@ -37,21 +145,26 @@ async def start_mock(user_id: int, bot: Bot, chat_id: int,
     """Start a mock test session for the user."""
     questions = await get_questions(section=section, limit=num_questions)
     if not questions:
-        await bot.send_message(chat_id, "❌ No questions available for this selection.")
+        await send(chat_id, lambda: bot.send_message(chat_id, "❌ No questions available for this selection."))
         return
 
-    mock_id = str(int(time.time()))
+    mock_id = uuid.uuid4().hex[:12]   # unique even for restarts within a second
+    nbytes  = (len(questions) + 7) // 8
+    # Per-question outcome bitmaps; bm_taken marks a question claimed by a
+    # handler, the others record how it was resolved
     _active_mocks[user_id] = {
         "mock_id":    mock_id,
         "chat_id":    chat_id,
         "paper":      paper or 2,
-        "questions":  questions,
+        "questions":  [_pack_question(q, i, mock_id) for i, q in enumerate(questions)],
         "current":    0,
-        "correct":    0,
-        "wrong":      0,
-        "skipped":    0,
         "start_time": time.time(),
-        "answered":   {},
+        "last_active": time.time(),
+        "bm_taken":   bytearray(nbytes),
+        "bm_correct": bytearray(nbytes),
+        "bm_wrong":   bytearray(nbytes),
+        "bm_skip":    bytearray(nbytes),
+        "poll_ids":   [],
     }
 
     header = (
@@ -60,12 +173,12 @@ async def start_mock(user_id: int, bot: Bot, chat_id: int,
         f"➕ +1 per correct | ➖ -{NEGATIVE_MARKING_RATIO:.2f} per wrong\n"
         f"⏱️ Take your time, think before answering!\n\n"
     )
-    await bot.send_message(chat_id, header, parse_mode="Markdown")
+    await send(chat_id, lambda: bot.send_message(chat_id, header, parse_mode="Markdown"))
     await _send_question(bot, user_id)
 
 
 async def _send_question(bot: Bot, user_id: int) -> None:
-    state = _active_mocks.get(user_id)
+    state = _get_mock(user_id)
     if not state:
         return
 
@@ -77,22 +190,49 @@ async def _send_question(bot: Bot, user_id: int) -> None:
         return
 
     q = questions[idx]
-    opts = [q['opt_a'], q['opt_b'], q['opt_c'], q['opt_d']]
-    labels = ["A", "B", "C", "D"]
-    opts_text = "\n".join(f"  *{labels[i]})* {o}" for i, o in enumerate(opts) if o)
+    chat_id = state['chat_id']
+    if q.poll_opts:
+        # One quiz poll per question: Telegram shows the verdict and explanation
+        # itself, so answers need no outgoing feedback message
+        poll_msg = await send(chat_id, lambda: bot.send_poll(
+            chat_id,
+            question=f"Q{idx + 1}/{len(questions)}. {q.question}",
+            options=list(q.poll_opts),
+            type="quiz",
+            correct_option_id=q.answer_idx,
+            is_anonymous=False,
+            explanation=q.explanation[:POLL_EXPLANATION_MAX] or None,
+            reply_markup=q.keyboard,
+        ))
+        _poll_owner[poll_msg.poll.id] = (user_id, state['mock_id'], idx)
+        state['poll_ids'].append(poll_msg.poll.id)
+        return
+
+    text = f"❓ *Q{idx + 1}/{len(questions)}*\n\n" + q.body
+    await send(chat_id, lambda: bot.send_message(chat_id, text,
+                                                 parse_mode="Markdown",
+                                                 reply_markup=q.keyboard))
+
+
+def _advance(bot: Bot, user_id: int, state: dict) -> None:
+    """Move to the next question and send it without holding up the handler."""
+    state['current'] += 1
+    state['last_active'] = time.time()
+    task = asyncio.create_task(_send_question(bot, user_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
-    text = (
-        f"❓ *Q{idx + 1}/{len(questions)}*\n\n"
-        f"{q['question']}\n\n"
-        f"{opts_text}\n\n"
-        f"_Level: {q.get('level', '?').title()} | "
-        f"Paper {q.get('paper', '?')}_"
-    )
 
-    kb = _make_option_keyboard(idx, [o for o in opts if o], state['mock_id'])
-    await bot.send_message(state['chat_id'], text,
-                           parse_mode="Markdown",
-                           reply_markup=kb)
+async def _clear_keyboard(callback: CallbackQuery) -> None:
+    """Best-effort removal of the answer buttons; never aborts scoring."""
+    try:
+        await send(callback.message.chat.id,
+                   lambda: callback.message.edit_reply_markup(reply_markup=None))
+    except TelegramBadRequest as e:
+        if "not modified" not in str(e):
+            log.warning(f"Keyboard not cleared for chat {callback.message.chat.id}: {e}")
+    except TelegramRetryAfter as e:
+        log.warning(f"Keyboard not cleared for chat {callback.message.chat.id}: {e}")
 
 
 async def handle_mock_answer(callback: CallbackQuery, bot: Bot) -> None:
@@ -104,17 +244,23 @@ async def handle_mock_answer(callback: CallbackQuery, bot: Bot) -> None:
 
     _, mock_id, q_index_str, answer_str = parts[0], parts[1], parts[2], parts[3]
     user_id  = callback.from_user.id
-    state    = _active_mocks.get(user_id)
+    state    = _get_mock(user_id)
 
     if not state or state['mock_id'] != mock_id:
         await callback.answer("❌ No active mock found.", show_alert=True)
         return
 
     q_index = int(q_index_str)
+    if answer_str != "end":
+        # A double tap, or Skip under a quiz poll that was already answered
+        if q_index != state['current'] or _get_bit(state['bm_taken'], q_index):
+            await callback.answer("Already answered.")
+            return
+        _set_bit(state['bm_taken'], q_index)   # claim it before awaiting
     q = state['questions'][q_index]
-    opts = [q['opt_a'], q['opt_b'], q['opt_c'], q['opt_d']]
+    opts = q.opts
 
-    await callback.message.edit_reply_markup(reply_markup=None)
+    await _clear_keyboard(callback)
 
     if answer_str == "end":
         await callback.answer("Ending mock...")
@@ -123,46 +269,63 @@ async def handle_mock_answer(callback: CallbackQuery, bot: Bot) -> None:
         return
 
     if answer_str == "skip":
-        state['skipped'] += 1
-        state['answered'][q_index] = 'skip'
-        feedback = f"⏭️ *Q{q_index + 1} Skipped*\n✅ Correct: *{opts[q['answer_idx']]}*"
-        if q.get('explanation'):
-            feedback += f"\n💡 _{q['explanation']}_"
-        await callback.message.reply(feedback, parse_mode="Markdown")
+        _set_bit(state['bm_skip'], q_index)
+        feedback = FEEDBACK_SKIPPED(q_index + 1, opts[q.answer_idx])
+        if q.explanation:
+            feedback += f"\n💡 _{q.explanation}_"
     else:
         chosen = int(answer_str)
-        correct_idx = q['answer_idx']
-        labels = ["A", "B", "C", "D"]
+        correct_idx = q.answer_idx
         if chosen == correct_idx:
-            state['correct'] += 1
-            state['answered'][q_index] = 'correct'
-            feedback = f"✅ *Correct! +1 mark*\n📖 _{q.get('explanation', '')}_"
+            _set_bit(state['bm_correct'], q_index)
+            feedback = FEEDBACK_CORRECT(q.explanation)
         else:
-            state['wrong'] += 1
-            state['answered'][q_index] = 'wrong'
-            feedback = (
-                f"❌ *Wrong! -{NEGATIVE_MARKING_RATIO:.2f} mark*\n"
-                f"Your answer: *{labels[chosen]}) {opts[chosen]}*\n"
-                f"✅ Correct: *{labels[correct_idx]}) {opts[correct_idx]}*\n"
-                f"💡 _{q.get('explanation', '')}_"
-            )
-        await callback.message.reply(feedback, parse_mode="Markdown")
-
-    await callback.answer()
-    state['current'] += 1
-    await asyncio.sleep(1)
-    await _send_question(bot, user_id)
+            _set_bit(state['bm_wrong'], q_index)
+            feedback = FEEDBACK_WRONG(LABELS[chosen], opts[chosen],
+                                      LABELS[correct_idx], opts[correct_idx],
+                                      q.explanation)
+
+    # The answer is already scored: a failed reply must not leave the
+    # question claimed with the mock stuck on it
+    try:
+        await send(callback.message.chat.id,
+                   lambda: callback.message.reply(feedback, parse_mode="Markdown"))
+        await callback.answer()
+    except TelegramAPIError as e:
+        log.warning(f"Mock feedback not sent to user {user_id}: {e}")
+    # send_queue already spaces this after the feedback reply
+    _advance(bot, user_id, state)
+
+
+async def handle_mock_poll_answer(poll_answer: PollAnswer, bot: Bot) -> None:
+    """Handle a vote on a mock quiz poll. No reply: the poll shows the verdict."""
+    owner = _poll_owner.pop(poll_answer.poll_id, None)
+    if owner is None or not poll_answer.option_ids:
+        return
+    user_id, mock_id, q_index = owner
+    state = _get_mock(user_id)
+    # Ignore votes on a question already skipped (or being skipped)
+    if not state or state['mock_id'] != mock_id or state['current'] != q_index \
+            or _get_bit(state['bm_taken'], q_index):
+        return
+
+    _set_bit(state['bm_taken'], q_index)
+    if poll_answer.option_ids[0] == state['questions'][q_index].answer_idx:
+        _set_bit(state['bm_correct'], q_index)
+    else:
+        _set_bit(state['bm_wrong'], q_index)
+    _advance(bot, user_id, state)
 
 
 async def _finish_mock(bot: Bot, user_id: int) -> None:
-    state = _active_mocks.pop(user_id, None)
+    state = _drop_mock(user_id)
     if not state:
         return
 
     total_q   = len(state['questions'])
-    correct   = state['correct']
-    wrong     = state['wrong']
-    skipped   = state['skipped']
+    correct   = _popcount(state['bm_correct'])
+    wrong     = _popcount(state['bm_wrong'])
+    skipped   = _popcount(state['bm_skip'])
     attempted = correct + wrong
     time_taken = int(time.time() - state['start_time'])
 
@@ -203,7 +366,7 @@ async def _finish_mock(bot: Bot, user_id: int) -> None:
         f"{verdict}\n\n"
         f"_Use /report to get your detailed PDF analysis._"
     )
-    await bot.send_message(state['chat_id'], msg, parse_mode="Markdown")
+    await send(state['chat_id'], lambda: bot.send_message(state['chat_id'], msg, parse_mode="Markdown"))
 
 
 async def format_mock_history(user_id: int) -> str:
@@ -223,4 +386,4 @@ async def format_mock_history(user_id: int) -> str:
 
 
 def has_active_mock(user_id: int) -> bool:
-    return user_id in _active_mocks
+    return _get_mock(user_id) is not None
@@ -0,0 +1,290 @@
+"""
+report_pdf.py - Synchronous PDF/chart rendering for reports.py.
+Runs inside the report worker processes, so importing it must stay free of
+side effects: no DB, no config, no bot objects.
+"""
+import io
+import queue
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import (
+    SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle,
+    Image as RLImage, HRFlowable
+)
+from reportlab.lib.enums import TA_CENTER
+
+
+# ── Color palette ─────────────────────────────────────────────────────────────
+CLR_PRIMARY   = colors.HexColor("#1A237E")   # deep blue
+CLR_ACCENT    = colors.HexColor("#0288D1")   # vivid blue
+CLR_GREEN     = colors.HexColor("#2E7D32")
+CLR_RED       = colors.HexColor("#C62828")
+CLR_ORANGE    = colors.HexColor("#E65100")
+CLR_BG        = colors.HexColor("#F5F5F5")
+CLR_WHITE     = colors.white
+
+# ── Paragraph & table styles (built once) ─────────────────────────────────────
+_STYLES = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'Title', parent=_STYLES['Title'],
+    textColor=CLR_PRIMARY, fontSize=18, spaceAfter=4
+)
+H2_STYLE = ParagraphStyle(
+    'H2', parent=_STYLES['Heading2'],
+    textColor=CLR_ACCENT, fontSize=13, spaceAfter=4, spaceBefore=10
+)
+NORMAL_STYLE = _STYLES['Normal']
+NORMAL_STYLE.fontSize = 9
+FOOTER_STYLE = ParagraphStyle('footer', parent=NORMAL_STYLE, textColor=colors.grey,
+                              alignment=TA_CENTER, fontSize=8)
+
+_TBL_STYLE_SUMMARY = TableStyle([
+    ('BACKGROUND',   (0, 0), (-1, 0),  CLR_PRIMARY),
+    ('TEXTCOLOR',    (0, 0), (-1, 0),  CLR_WHITE),
+    ('FONTNAME',     (0, 0), (-1, 0),  'Helvetica-Bold'),
+    ('FONTSIZE',     (0, 0), (-1, 0),  10),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [CLR_BG, CLR_WHITE]),
+    ('ALIGN',        (1, 0), (-1, -1), 'CENTER'),
+    ('GRID',         (0, 0), (-1, -1), 0.5, colors.grey),
+    ('FONTSIZE',     (0, 1), (-1, -1), 9),
+    ('TOPPADDING',   (0, 0), (-1, -1), 5),
+    ('BOTTOMPADDING',(0, 0), (-1, -1), 5),
+])
+_TBL_STYLE_WEAK = TableStyle([
+    ('BACKGROUND',   (0, 0), (-1, 0),  CLR_RED),
+    ('TEXTCOLOR',    (0, 0), (-1, 0),  CLR_WHITE),
+    ('FONTNAME',     (0, 0), (-1, 0),  'Helvetica-Bold'),
+    ('FONTSIZE',     (0, 0), (-1, -1), 8),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.HexColor("#FFF3E0"), CLR_WHITE]),
+    ('GRID',         (0, 0), (-1, -1), 0.5, colors.grey),
+    ('TOPPADDING',   (0, 0), (-1, -1), 4),
+    ('BOTTOMPADDING',(0, 0), (-1, -1), 4),
+])
+_TBL_STYLE_MOCK = TableStyle([
+    ('BACKGROUND',   (0, 0), (-1, 0),  CLR_ACCENT),
+    ('TEXTCOLOR',    (0, 0), (-1, 0),  CLR_WHITE),
+    ('FONTNAME',     (0, 0), (-1, 0),  'Helvetica-Bold'),
+    ('FONTSIZE',     (0, 0), (-1, -1), 8),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [CLR_BG, CLR_WHITE]),
+    ('ALIGN',        (1, 0), (-1, -1), 'CENTER'),
+    ('GRID',         (0, 0), (-1, -1), 0.5, colors.grey),
+    ('TOPPADDING',   (0, 0), (-1, -1), 4),
+    ('BOTTOMPADDING',(0, 0), (-1, -1), 4),
+])
+
+_SUMMARY_HEADER = ("Metric", "Value", "Target")
+_WEAK_HEADER    = ("Topic", "Section", "Done %", "Accuracy %", "PDF Resource")
+_MOCK_HEADER    = ("Date", "Paper", "Score (Net)", "Accuracy", "Correct", "Wrong")
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# CHART GENERATORS
+# ────────────────────────────────────────────────────────────────────────────
+# Charts draw on pooled Figures (not pyplot) so they skip per-chart figure
+# construction/teardown and never touch pyplot's global state.
+CHART_DPI = 100
+_FIG_POOL: queue.Queue = queue.Queue()
+for _ in range(2):
+    _FIG_POOL.put(Figure())
+
+
+@contextmanager
+def _pooled_axes(figsize: tuple, **margins):
+    """Borrow a cleared Figure of the given size; yields (fig, ax)."""
+    fig = _FIG_POOL.get()
+    try:
+        fig.clear()
+        fig.set_size_inches(*figsize)
+        fig.subplots_adjust(**margins)   # fixed margins instead of tight bbox
+        yield fig, fig.add_subplot()
+    finally:
+        _FIG_POOL.put(fig)
+
+
+def _png(fig: Figure) -> io.BytesIO:
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=CHART_DPI)
+    buf.seek(0)
+    return buf
+
+
+def _chart_weekly_hours(week: list[dict]) -> io.BytesIO:
+    """`week` is oldest-first (see generate_daily_report)."""
+    n      = len(week)
+    dates  = [w['session_date'][-5:] for w in week]   # MM-DD
+    hours  = np.fromiter((w['hours'] or 0 for w in week), float, n).round(2)
+    target = np.full(n, 10.5)
+
+    with _pooled_axes((7, 3.5), left=0.08, right=0.98, top=0.9, bottom=0.14) as (fig, ax):
+        ax.bar(dates, hours, color="#0288D1", label="Actual", alpha=0.85, zorder=3)
+        ax.plot(dates, target, "r--", linewidth=1.5, label="Target (10.5h)", zorder=4)
+        ax.set_ylim(0, 14)
+        ax.set_xlabel("Date", fontsize=8)
+        ax.set_ylabel("Hours", fontsize=8)
+        ax.set_title("Weekly Study Hours", fontsize=10, fontweight='bold')
+        ax.legend(fontsize=7)
+        ax.grid(axis='y', alpha=0.3, zorder=0)
+        return _png(fig)
+
+
+def _chart_accuracy_trend(week: list[dict]) -> io.BytesIO:
+    """`week` is oldest-first (see generate_daily_report)."""
+    n        = len(week)
+    dates    = [w['session_date'][-5:] for w in week]
+    q        = np.fromiter((w['questions'] or 0 for w in week), float, n)
+    c        = np.fromiter((w['correct'] or 0 for w in week), float, n)
+    accuracy = (np.divide(c, q, out=np.zeros(n), where=q > 0) * 100).round(1)
+    mask_hi  = accuracy >= 50
+
+    with _pooled_axes((7, 3.5), left=0.09, right=0.98, top=0.9, bottom=0.14) as (fig, ax):
+        ax.plot(dates, accuracy, "o-", color="#2E7D32", linewidth=2, markersize=6)
+        ax.axhline(50, color='r', linestyle='--', linewidth=1, label='50% threshold')
+        ax.fill_between(dates, accuracy, 50, where=mask_hi,
+                        alpha=0.15, color='green')
+        ax.fill_between(dates, accuracy, 50, where=~mask_hi,
+                        alpha=0.15, color='red')
+        ax.set_ylim(0, 105)
+        ax.set_xlabel("Date", fontsize=8)
+        ax.set_ylabel("Accuracy %", fontsize=8)
+        ax.set_title("MCQ Accuracy Trend", fontsize=10, fontweight='bold')
+        ax.legend(fontsize=7)
+        ax.grid(alpha=0.3)
+        return _png(fig)
+
+
+def _chart_weak_topics(weak: list[dict]) -> io.BytesIO | None:
+    if not weak:
+        return None
+    top    = weak[:7]
+    names  = [n if len(n) <= 25 else n[:25] + '…' for n in (w['name'] for w in top)]
+    compl  = [w['completion_pct'] for w in top]
+    accu   = [w['accuracy_pct'] for w in top]
+
+    x      = np.arange(len(names))
+    width  = 0.35
+    with _pooled_axes((7, 4), left=0.3, right=0.98, top=0.92, bottom=0.12) as (fig, ax):
+        ax.barh(x - width/2, compl, width, label='Completion %', color='#0288D1', alpha=0.85)
+        ax.barh(x + width/2, accu,  width, label='Accuracy %',   color='#E65100', alpha=0.85)
+        ax.set_yticks(x)
+        ax.set_yticklabels(names, fontsize=7)
+        ax.axvline(60, color='b', linestyle=':', linewidth=1, label='60% min')
+        ax.axvline(50, color='r', linestyle=':', linewidth=1, label='50% min')
+        ax.set_xlim(0, 110)
+        ax.set_xlabel("Percentage", fontsize=8)
+        ax.set_title("Weak Topics Analysis", fontsize=10, fontweight='bold')
+        ax.legend(fontsize=7, loc='lower right')
+        ax.grid(axis='x', alpha=0.3)
+        return _png(fig)
+
+
+# ────────────────────────────────────────────────────────────────────────────
+# PDF BUILDER
+# ────────────────────────────────────────────────────────────────────────────
+def build_pdf(stats: dict, weekly: list[dict], weak: list[dict],
+              mocks: list[dict], first_name: str) -> bytes:
+    """Render the report from already-fetched data; returns the PDF bytes."""
+    today_str  = date.today().strftime("%d %B %Y")
+    out        = io.BytesIO()
+
+    doc    = SimpleDocTemplate(out, pagesize=A4,
+                               leftMargin=2*cm, rightMargin=2*cm,
+                               topMargin=2*cm, bottomMargin=2*cm)
+    title_style = TITLE_STYLE
+    h2_style    = H2_STYLE
+    normal      = NORMAL_STYLE
+
+    story = []
+
+    # ── Header ──────────────────────────────────────────────────────────────
+    story.append(Paragraph("📚 RPSC Study Bot — Daily Report", title_style))
+    story.append(Paragraph(f"Student: <b>{first_name}</b> | Date: {today_str}", normal))
+    story.append(HRFlowable(width="100%", thickness=2, color=CLR_PRIMARY))
+    story.append(Spacer(1, 0.3*cm))
+
+    # ── Today Stats Table ────────────────────────────────────────────────────
+    story.append(Paragraph("📊 Today's Summary", h2_style))
+    data = [
+        _SUMMARY_HEADER,
+        ["Hours Studied",   f"{stats['total_hours']}h", "10.5h"],
+        ["Questions Done",  str(stats['total_q']),       "≥ 30"],
+        ["Accuracy",        f"{stats['accuracy']}%",     "≥ 65%"],
+        ["Blocks Done",     f"{stats['plan_done']}/{stats['plan_total']}", "7/7"],
+    ]
+    tbl = Table(data, colWidths=[6*cm, 5*cm, 5*cm])
+    tbl.setStyle(_TBL_STYLE_SUMMARY)
+    story.append(tbl)
+    story.append(Spacer(1, 0.4*cm))
+
+    # ── Weekly Charts ────────────────────────────────────────────────────────
+    if weekly:
+        story.append(Paragraph("📈 Weekly Progress", h2_style))
+        week = weekly[::-1]   # oldest first, shared by both charts
+        buf_h = _chart_weekly_hours(week)
+        buf_a = _chart_accuracy_trend(week)
+        story.append(RLImage(buf_h, width=14*cm, height=7*cm))
+        story.append(Spacer(1, 0.2*cm))
+        story.append(RLImage(buf_a, width=14*cm, height=7*cm))
+        story.append(Spacer(1, 0.4*cm))
+
+    # ── Weak Topics ──────────────────────────────────────────────────────────
+    if weak:
+        story.append(Paragraph("🔴 Weak Topics Requiring Attention", h2_style))
+        buf_w = _chart_weak_topics(weak)
+        if buf_w:
+            story.append(RLImage(buf_w, width=14*cm, height=7*cm))
+            story.append(Spacer(1, 0.2*cm))
+
+        wt_data = [_WEAK_HEADER]
+        for w in weak:
+            wt_data.append([
+                w['name'][:30],
+                w['section'],
+                f"{w['completion_pct']}%",
+                f"{w['accuracy_pct']}%",
+                w.get('free_pdf_link', '')[:40] + "…" if len(w.get('free_pdf_link', '')) > 40 else w.get('free_pdf_link', ''),
+            ])
+        wt_tbl = Table(wt_data, colWidths=[5.5*cm, 2.5*cm, 2*cm, 2.5*cm, 4*cm])
+        wt_tbl.setStyle(_TBL_STYLE_WEAK)
+        story.append(wt_tbl)
+        story.append(Spacer(1, 0.4*cm))
+    else:
+        story.append(Paragraph("✅ No weak topics — Great work!", normal))
+        story.append(Spacer(1, 0.3*cm))
+
+    # ── Mock History ─────────────────────────────────────────────────────────
+    if mocks:
+        story.append(Paragraph("🎯 Recent Mock Tests", h2_style))
+        mk_data = [_MOCK_HEADER]
+        for m in mocks:
+            pct = round((m['score_net'] / m['total_q']) * 100, 1) if m['total_q'] > 0 else 0
+            mk_data.append([
+                m['mock_date'], f"Paper {m['paper']}",
+                f"{m['score_net']}/{m['total_q']}", f"{pct}%",
+                str(m['correct']), str(m['wrong'])
+            ])
+        mk_tbl = Table(mk_data, colWidths=[3*cm, 2.5*cm, 3.5*cm, 2.5*cm, 2*cm, 2*cm])
+        mk_tbl.setStyle(_TBL_STYLE_MOCK)
+        story.append(mk_tbl)
+        story.append(Spacer(1, 0.4*cm))
+
+    # ── Footer ───────────────────────────────────────────────────────────────
+    story.append(HRFlowable(width="100%", thickness=1, color=CLR_ACCENT))
+    story.append(Spacer(1, 0.2*cm))
+    story.append(Paragraph(
+        "🚀 <b>RPSC Study Bot</b> | antigravity_rpsc_tutor | "
+        "Consistency beats talent. Keep going!",
+        FOOTER_STYLE
+    ))
+
+    doc.build(story)
+    return out.getvalue()
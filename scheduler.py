@@ -3,6 +3,7 @@ scheduler.py - Persistent multi-user APScheduler jobs for RPSC Study Bot.
 Fetches all students from the DB on every job run to ensure 24/7 coverage.
 """
 import asyncio
+import io
 import logging
 from datetime import datetime, date, timedelta
 
@@ -10,27 +11,44 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from aiogram import Bot
+from aiogram.types import BufferedInputFile
 
 from config import (
     MORNING_BRIEFING_HOUR, MORNING_BRIEFING_MINUTE,
     NIGHT_SUMMARY_HOUR, NIGHT_SUMMARY_MINUTE,
     TIMEZONE, ADMIN_CHAT_ID
 )
+from send_queue import send
 
 log = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler(timezone=TIMEZONE)
 
 
+# ── Fan-out ───────────────────────────────────────────────────────────────────
+# Sends are paced by send_queue; this only bounds how many users are in flight.
+_CONCURRENCY = asyncio.Semaphore(50)
+
+
+async def _fan_out(users: list, job: str, body) -> None:
+    """Run body(u) for every user concurrently, at most 50 at a time."""
+    async def one(u):
+        async with _CONCURRENCY:
+            try:
+                await body(u)
+            except Exception as e:
+                log.error(f"{job} failed for {u['user_id']}: {e}")
+
+    await asyncio.gather(*(one(u) for u in users))
+
+
 async def _get_all_users() -> list:
     """Fetch all users from the DB safely."""
-    import aiosqlite
-    from config import DB_PATH
+    from db import get_db
     users = []
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            cur = await db.execute("SELECT user_id, first_name FROM users")
-            users = [dict(r) for r in await cur.fetchall()]
+        db = await get_db()
+        cur = await db.execute("SELECT user_id, first_name FROM users")
+        users = [dict(r) for r in await cur.fetchall()]
     except Exception as e:
         log.error(f"Failed to fetch users for scheduler: {e}")
     return users
@@ -44,102 +62,105 @@ def register_user_for_notifications(user_id: int, first_name: str) -> None:
 # ── Job helpers ───────────────────────────────────────────────────────────────
 async def _morning_briefing(bot: Bot) -> None:
     """7 AM daily briefing for ALL registered students."""
-    from planning import generate_daily_plan, format_plan_message, get_exam_countdown
+    from planning import generate_plans_bulk, format_plan_message, get_exam_countdown
     from db import get_streak, get_user_profile
 
     users = await _get_all_users()
-    for u in users:
+    plans = dict(zip((u['user_id'] for u in users),
+                     await generate_plans_bulk([u['user_id'] for u in users])))
+    countdown = await get_exam_countdown()
+
+    async def one(u) -> None:
         uid = u['user_id']
         name = u['first_name']
-        try:
-            profile = await get_user_profile(uid)
-            h = profile['recommended_daily_hours'] if profile else 10.5
-            streak   = await get_streak(uid)
-            blocks   = await generate_daily_plan(uid)
-            plan_msg = await format_plan_message(blocks, daily_hours=h)
-            countdown = await get_exam_countdown()
-            
-            greeting = (
-                f"🌅 *Good Morning, {name}!* 📖\n"
-                f"🔥 Streak: *{streak} days*\n"
-                f"{countdown}\n\n"
-                f"Today's personalised target: *{h}h*\n\n"
-                + plan_msg
-            )
-            await bot.send_message(uid, greeting, parse_mode="Markdown",
-                                   disable_web_page_preview=True)
-        except Exception as e:
-            log.error(f"Morning briefing failed for {uid}: {e}")
+        blocks = plans[uid]
+        if isinstance(blocks, Exception):
+            raise blocks
+        profile = await get_user_profile(uid)
+        h = profile['recommended_daily_hours'] if profile else 10.5
+        streak   = await get_streak(uid)
+        plan_msg = await format_plan_message(blocks, daily_hours=h)
+
+        greeting = (
+            f"🌅 *Good Morning, {name}!* 📖\n"
+            f"🔥 Streak: *{streak} days*\n"
+            f"{countdown}\n\n"
+            f"Today's personalised target: *{h}h*\n\n"
+            + plan_msg
+        )
+        await send(uid, lambda: bot.send_message(uid, greeting, parse_mode="Markdown",
+                                                 disable_web_page_preview=True))
+
+    await _fan_out(users, "Morning briefing", one)
 
 
 async def _night_summary(bot: Bot) -> None:
     """10 PM nightly summary for ALL active students."""
-    from db import get_today_stats, update_streak, save_calibration
+    from db import get_today_stats_bulk, update_streak, save_calibration
     from reports import generate_daily_report
     from questions import start_mock
     
     users = await _get_all_users()
-    for u in users:
+    all_stats = await get_today_stats_bulk([u['user_id'] for u in users])
+
+    async def one(u) -> None:
         uid = u['user_id']
         name = u['first_name']
-        try:
-            stats  = await get_today_stats(uid)
-            
-            # Skip if they logged nothing today (no annoying empty reports)
-            if stats['total_hours'] == 0 and stats['total_q'] == 0:
-                continue
-
-            streak = await update_streak(uid, stats['total_hours'])
-
-            # --- AI Calibration: auto-adjust next day based on performance ---
-            accuracy_frac     = stats['accuracy'] / 100.0
-            plan_completion   = (stats['plan_done'] / stats['plan_total']
-                                 if stats['plan_total'] > 0 else 0)
-            cal_result = await save_calibration(
-                user_id        = uid,
-                accuracy       = accuracy_frac,
-                completion_rate = plan_completion,
-                actual_hours   = stats['total_hours'],
-                questions_done = stats['total_q'],
-                correct        = stats['total_correct'],
-            )
-
-            msg = (
-                f"🌙 *Good Night, {name}!*\n\n"
-                f"📊 *Today's Summary:*\n"
-                f"  ⏱️ Hours: *{stats['total_hours']}h*\n"
-                f"  ✅ Questions: *{stats['total_q']}* (Accuracy: {stats['accuracy']}%)\n"
-                f"  📋 Blocks: *{stats['plan_done']}/{stats['plan_total']} done*\n"
-                f"  🔥 Streak: *{streak} days*\n\n"
-            )
-            if cal_result.get('adjustment_msg'):
-                msg += f"🤖 *AI Adjustment:* {cal_result['adjustment_msg']}\n\n"
-
-            msg += "\n_Generating your PDF report…_"
-            await bot.send_message(uid, msg, parse_mode="Markdown")
-
-            pdf_path = await generate_daily_report(uid, name)
-            with open(pdf_path, 'rb') as f:
-                await bot.send_document(
-                    uid, f,
-                    caption=(
-                        f"📄 Daily Report — {date.today().strftime('%d %b %Y')}\n"
-                        f"New target: {cal_result['new_hours']}h tomorrow"
-                    )
-                )
-            
-            # Nightly 5Q Calibration micro-test
-            await asyncio.sleep(2)
-            await bot.send_message(
-                uid,
-                "🧪 *Nightly Calibration — 5 Quick Questions*\n"
-                "_Answer to help the AI fine-tune tomorrow!_",
-                parse_mode="Markdown"
+        stats  = all_stats[uid]
+        
+        # Skip if they logged nothing today (no annoying empty reports)
+        if stats['total_hours'] == 0 and stats['total_q'] == 0:
+            return
+
+        streak = await update_streak(uid, stats['total_hours'])
+
+        # --- AI Calibration: auto-adjust next day based on performance ---
+        accuracy_frac     = stats['accuracy'] / 100.0
+        plan_completion   = (stats['plan_done'] / stats['plan_total']
+                             if stats['plan_total'] > 0 else 0)
+        cal_result = await save_calibration(
+            user_id        = uid,
+            accuracy       = accuracy_frac,
+            completion_rate = plan_completion,
+            actual_hours   = stats['total_hours'],
+            questions_done = stats['total_q'],
+            correct        = stats['total_correct'],
+        )
+
+        msg = (
+            f"🌙 *Good Night, {name}!*\n\n"
+            f"📊 *Today's Summary:*\n"
+            f"  ⏱️ Hours: *{stats['total_hours']}h*\n"
+            f"  ✅ Questions: *{stats['total_q']}* (Accuracy: {stats['accuracy']}%)\n"
+            f"  📋 Blocks: *{stats['plan_done']}/{stats['plan_total']} done*\n"
+            f"  🔥 Streak: *{streak} days*\n\n"
+        )
+        if cal_result.get('adjustment_msg'):
+            msg += f"🤖 *AI Adjustment:* {cal_result['adjustment_msg']}\n\n"
+
+        msg += "\n_Generating your PDF report…_"
+        await send(uid, lambda: bot.send_message(uid, msg, parse_mode="Markdown"))
+
+        pdf = await generate_daily_report(uid, name)
+        await send(uid, lambda: bot.send_document(
+            uid, BufferedInputFile(pdf, filename=f"report_{date.today().isoformat()}.pdf"),
+            caption=(
+                f"📄 Daily Report — {date.today().strftime('%d %b %Y')}\n"
+                f"New target: {cal_result['new_hours']}h tomorrow"
             )
-            await start_mock(uid, bot, uid, num_questions=5)
+        ))
+        
+        # Nightly 5Q Calibration micro-test
+        await asyncio.sleep(2)
+        await send(uid, lambda: bot.send_message(
+            uid,
+            "🧪 *Nightly Calibration — 5 Quick Questions*\n"
+            "_Answer to help the AI fine-tune tomorrow!_",
+            parse_mode="Markdown"
+        ))
+        await start_mock(uid, bot, uid, num_questions=5)
 
-        except Exception as e:
-            log.error(f"Night summary failed for {uid}: {e}")
+    await _fan_out(users, "Night summary", one)
 
 
 async def _block_reminder(bot: Bot) -> None:
@@ -149,23 +170,25 @@ async def _block_reminder(bot: Bot) -> None:
 
 async def _motivational_nag(bot: Bot) -> None:
     """2 PM nag check for students who missed their target."""
-    from db import get_today_stats
+    from db import get_today_stats_bulk
     users = await _get_all_users()
-    for u in users:
+    all_stats = await get_today_stats_bulk([u['user_id'] for u in users])
+
+    async def one(u) -> None:
         uid = u['user_id']
         name = u['first_name']
-        try:
-            stats = await get_today_stats(uid)
-            if stats['total_hours'] < 2.0:
-                nags = [
-                    f"😤 {name}! Only {stats['total_hours']}h studied by 2 PM?! Move it!",
-                    f"🔴 {name}, your competition studied 5h already! You? {stats['total_hours']}h!",
-                    f"⚡ {name}, RPSC selection rewards sweat, not sleep. Back to work!",
-                ]
-                import random
-                await bot.send_message(uid, random.choice(nags), parse_mode="Markdown")
-        except Exception as e:
-            log.error(f"Nag failed for {uid}: {e}")
+        stats = all_stats[uid]
+        if stats['total_hours'] < 2.0:
+            nags = [
+                f"😤 {name}! Only {stats['total_hours']}h studied by 2 PM?! Move it!",
+                f"🔴 {name}, your competition studied 5h already! You? {stats['total_hours']}h!",
+                f"⚡ {name}, RPSC selection rewards sweat, not sleep. Back to work!",
+            ]
+            import random
+            nag = random.choice(nags)
+            await send(uid, lambda: bot.send_message(uid, nag, parse_mode="Markdown"))
+
+    await _fan_out(users, "Nag", one)
 
 
 async def _admin_daily_report(bot: Bot) -> None:
@@ -176,30 +199,38 @@ async def _admin_daily_report(bot: Bot) -> None:
 
     try:
         data = await get_admin_leaderboard()
-        lines = [
-            f"👑 *RPSC Study Bot — Admin Daily Dashboard*",
-            f"📅 {date.today().strftime('%d %B %Y')}\n",
-            f"🏆 *Top Performers (Most Hours)*"
-        ]
+        buf = io.StringIO()
+        w = buf.write
+        w("👑 *RPSC Study Bot — Admin Daily Dashboard*\n")
+        w(f"📅 {date.today().strftime('%d %B %Y')}\n\n")
+        w("🏆 *Top Performers (Most Hours)*\n")
         for i, u in enumerate(data['top'], 1):
-            acc = int(u.get('acc', 0) or 0)
-            lines.append(f"  {i}. {u['first_name']}: *{u['total_h']}h* ({acc}% acc)")
-        
-        lines.append(f"\n✅ *On Track (High Adherence)*")
+            w(f"  {i}. {u['first_name']}: *{u['total_h']}h* ({int(u.get('acc') or 0)}% acc)\n")
+
+        w("\n✅ *On Track (High Adherence)*\n")
         for i, u in enumerate(data['on_track'], 1):
-            lines.append(f"  {i}. {u['first_name']}: *{u['done_blocks']} blocks* done")
+            w(f"  {i}. {u['first_name']}: *{u['done_blocks']} blocks* done\n")
 
-        lines.append(f"\n🛑 *Attention Needed (Low Study)*")
+        w("\n🛑 *Attention Needed (Low Study)*\n")
         for i, u in enumerate(data['low'], 1):
-            lines.append(f"  {i}. {u['first_name']}: *{u['total_h']}h today*")
+            w(f"  {i}. {u['first_name']}: *{u['total_h']}h today*\n")
 
-        lines.append(f"\n_Keep motivating them! RPSC selection guarantees await._")
-        
-        await bot.send_message(ADMIN_CHAT_ID, "\n".join(lines), parse_mode="Markdown")
+        w("\n_Keep motivating them! RPSC selection guarantees await._")
+        text = buf.getvalue()
+        await send(ADMIN_CHAT_ID, lambda: bot.send_message(ADMIN_CHAT_ID, text,
+                                                           parse_mode="Markdown"))
     except Exception as e:
         log.error(f"Admin report failed: {e}")
 
 
+async def _sweep_idle_mocks() -> None:
+    """Evict mocks abandoned mid-test, with their unanswered polls."""
+    from questions import sweep_idle_mocks
+    dropped = sweep_idle_mocks()
+    if dropped:
+        log.info(f"Dropped {dropped} idle mock(s)")
+
+
 # ── Scheduler setup ───────────────────────────────────────────────────────────
 def setup_scheduler(bot: Bot) -> None:
     """Register all scheduled jobs."""
@@ -240,6 +271,13 @@ def setup_scheduler(bot: Bot) -> None:
         replace_existing=True,
     )
 
+    scheduler.add_job(
+        _sweep_idle_mocks,
+        IntervalTrigger(minutes=30),
+        id="sweep_idle_mocks",
+        replace_existing=True,
+    )
+
     if not scheduler.running:
         scheduler.start()
     log.info("✅ Scheduler started (Multi-User Persistence ON)")
@@ -0,0 +1,84 @@
+"""
+send_queue.py - Paced outgoing Telegram calls.
+Keeps the bot under Telegram's flood limits: ~30 msg/s bot-wide and
+~1 msg/s per chat. Bursts are delayed, not dropped.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from aiogram.exceptions import TelegramRetryAfter
+
+log = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Async token bucket: at most `rate` acquisitions per `period` seconds."""
+
+    def __init__(self, rate: int, period: float = 1.0):
+        self.rate       = rate
+        self.period     = period
+        self._tokens    = float(rate)
+        self._last      = time.monotonic()
+        self._resume_at = 0.0
+        self._lock      = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Hold all acquisitions for `seconds` (Telegram RetryAfter)."""
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:   # waiters are served in arrival order
+            while True:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now)
+                    continue
+                self._tokens = min(self.rate,
+                                   self._tokens + (now - self._last) * self.rate / self.period)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.period / self.rate)
+
+
+class OutgoingQueue:
+    """Shapes outgoing calls with a global bucket plus per-chat spacing."""
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, global_rate: int = 28, chat_interval: float = 1.05):
+        self.global_limiter = TokenBucket(global_rate, 1.0)
+        self.chat_interval  = chat_interval
+        self._chat_next: dict[int, float] = {}   # chat_id → earliest next send
+
+    def _reserve_chat_slot(self, chat_id: int) -> float:
+        """Book the chat's next free slot; returns seconds to wait for it."""
+        now  = time.monotonic()
+        slot = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + self.chat_interval
+        if len(self._chat_next) > 10_000:   # forget chats that have gone quiet
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        return slot - now
+
+    async def send(self, chat_id: int, call: Callable[[], Awaitable[T]]) -> T:
+        """Run call() (e.g. lambda: bot.send_message(...)) once it's our turn."""
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            delay = self._reserve_chat_slot(chat_id)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.global_limiter.acquire()
+            try:
+                return await call()
+            except TelegramRetryAfter as e:
+                if attempt == self.MAX_ATTEMPTS:
+                    raise
+                log.warning(f"Flood control for chat {chat_id}: retrying in {e.retry_after}s")
+                self.global_limiter.pause(e.retry_after + 0.1)
+
+
+outgoing = OutgoingQueue()
+send = outgoing.send
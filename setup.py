@@ -3,48 +3,57 @@ setup.py - First-run environment checker and database initialiser.
 Run this before bot.py if you want to verify your setup.
 """
 import asyncio
+import io
 import os
 import sys
+from collections.abc import Callable, Mapping
+from contextlib import redirect_stdout
+from importlib.util import find_spec
 
 # Force UTF-8 output on Windows
 if sys.stdout.encoding and sys.stdout.encoding.lower() != 'utf-8':
-    import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
 
 
-def check_env() -> bool:
+def check_env(env: Mapping[str, str], say: Callable[[str], None] = print) -> bool:
     ok = True
-    token = os.getenv("BOT_TOKEN", "")
-    admin = os.getenv("ADMIN_CHAT_ID", "0")
+    token = env.get("BOT_TOKEN", "")
+    admin = env.get("ADMIN_CHAT_ID", "0")
 
-    print("\n[*] Checking environment...")
+    say("\n[*] Checking environment...")
     if not token or token == "your_telegram_bot_token_here":
-        print("  [FAIL] BOT_TOKEN not set in .env")
+        say("  [FAIL] BOT_TOKEN not set in .env")
         ok = False
     else:
-        print(f"  [OK] BOT_TOKEN found ({token[:8]}...)")
+        say(f"  [OK] BOT_TOKEN found ({token[:8]}...)")
 
     if admin == "0":
-        print("  [WARN] ADMIN_CHAT_ID not set - notifications will be disabled")
+        say("  [WARN] ADMIN_CHAT_ID not set - notifications will be disabled")
     else:
-        print(f"  [OK] ADMIN_CHAT_ID: {admin}")
+        say(f"  [OK] ADMIN_CHAT_ID: {admin}")
 
     return ok
 
 
-def check_data_files() -> bool:
+def check_data_files(say: Callable[[str], None] = print) -> bool:
     ok = True
     files = [
         "data/biology_topics.csv",
         "data/paper1_topics.csv",
         "data/questions_sample.json",
     ]
-    print("\n[*] Checking data files...")
+    say("\n[*] Checking data files...")
+    # EAFP: opening the file checks presence and readability in one go
     for f in files:
-        if os.path.exists(f):
-            print(f"  [OK] {f}")
-        else:
-            print(f"  [FAIL] {f} MISSING")
+        try:
+            with open(f, 'rb') as fh:
+                fh.read(1)
+            say(f"  [OK] {f}")
+        except FileNotFoundError:
+            say(f"  [FAIL] {f} MISSING")
+            ok = False
+        except OSError as e:
+            say(f"  [FAIL] {f} unreadable ({e.strerror})")
             ok = False
     return ok
 
@@ -55,7 +64,7 @@ async def init_database() -> None:
     await init_db()
 
 
-def check_packages() -> bool:
+def check_packages(say: Callable[[str], None] = print) -> bool:
     ok = True
     required = [
         ("aiogram",     "aiogram"),
@@ -67,34 +76,59 @@ def check_packages() -> bool:
         ("dotenv",      "python-dotenv"),
         ("pandas",      "pandas"),
     ]
-    print("\n[*] Checking packages...")
+    say("\n[*] Checking packages...")
+    # find_spec locates the package without executing it (pandas, matplotlib
+    # and reportlab are slow to import and unused here)
     for imp, pkg in required:
-        try:
-            __import__(imp)
-            print(f"  [OK] {pkg}")
-        except ImportError:
-            print(f"  [FAIL] {pkg} not installed -- run: pip install {pkg}")
+        if find_spec(imp) is not None:
+            say(f"  [OK] {pkg}")
+        else:
+            say(f"  [FAIL] {pkg} not installed -- run: pip install {pkg}")
             ok = False
     return ok
 
 
+async def run_all(env: Mapping[str, str]) -> bool:
+    """
+    Run the checks in threads alongside database init. Each check writes to
+    its own buffer and init_db()'s prints are captured, so everything is
+    printed afterwards in the usual order — also when init fails, whose
+    error is re-raised once the report is out.
+    """
+    pkg_out, env_out, data_out = [], [], []
+    db_out = io.StringIO()
+    # The checks only write through say(), so this captures init alone
+    with redirect_stdout(db_out):
+        results = await asyncio.gather(
+            asyncio.to_thread(check_packages, pkg_out.append),
+            asyncio.to_thread(check_env, env, env_out.append),
+            asyncio.to_thread(check_data_files, data_out.append),
+            init_database(),
+            return_exceptions=True,
+        )
+    for line in (*pkg_out, *env_out, *data_out):
+        print(line)
+    print(db_out.getvalue(), end="")
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    pkg_ok, env_ok, data_ok, _ = results
+    return pkg_ok and env_ok and data_ok
+
+
 def main() -> None:
     from dotenv import load_dotenv
     load_dotenv()
+    env = dict(os.environ)   # one snapshot for the whole setup run
 
     print("=" * 50)
     print("  RPSC Study Bot -- Setup Checker")
     print("=" * 50)
 
-    all_ok = True
-    all_ok &= check_packages()
-    all_ok &= check_env()
-    all_ok &= check_data_files()
-
     os.makedirs("data",    exist_ok=True)
     os.makedirs("reports", exist_ok=True)
 
-    asyncio.run(init_database())
+    all_ok = asyncio.run(run_all(env))
 
     print("\n" + "=" * 50)
     if all_ok:
@@ -1,7 +1,12 @@
 """
 syllabus.py - Syllabus display and book recommendations
 """
-from db import get_all_topics, get_topic
+import asyncio
+import io
+from collections import defaultdict
+from operator import attrgetter, itemgetter
+
+from db import Topic, get_cached_topics_with_totals, get_topic, get_distinct_books
 
 
 SECTION_EMOJIS = {
@@ -20,41 +25,115 @@ PRIORITY_EMOJI = {
     "LOW":    "🟢",
 }
 
+# Pre-formatted pieces for the syllabus renderer, each carrying the newline
+# that separates it from the previous line
+_SECTION_HEADER_FMT = {
+    sec: f"\n\n{emoji} *{sec}* _(~{{}} marks)_".format
+    for sec, emoji in SECTION_EMOJIS.items()
+}
+_PRI_PREFIX = {pri: f"\n  {emoji} *" for pri, emoji in PRIORITY_EMOJI.items()}
+
+# Row field unpackers for the render loops
+_topic_fields = attrgetter('name', 'marks_weight', 'target_hours',
+                           'recommended_books', 'free_pdf_link', 'priority')
+_book_fields  = itemgetter('name', 'section', 'recommended_books', 'free_pdf_link')
+
+# (section, priority) → (section emoji, priority emoji) in one probe
+_COMBO = {
+    (sec, pri): (se, pe)
+    for sec, se in SECTION_EMOJIS.items()
+    for pri, pe in PRIORITY_EMOJI.items()
+}
+
+
+# ── Rendered text cache ─────────────────────────────────────────────────────
+# Only three syllabus variants (paper None/1/2) and one book list exist, so
+# keep the finished strings rather than re-rendering on every request.
+# Topics only change in init_db(), which runs before warm_syllabus_cache(),
+# so nothing ever needs dropping.
+_RENDERED: dict[int | None, str] = {}
+_RENDERED_BOOKS: str | None = None
+
+
+_PAPERS = (None, 1, 2)
+
+
+async def warm_syllabus_cache() -> None:
+    """
+    Render every syllabus variant and the book list; run at startup.
+    All fetches go out together and the four texts are rendered in a single
+    worker-thread call.
+    """
+    global _RENDERED_BOOKS
+    *fetched, books = await asyncio.gather(
+        *(get_cached_topics_with_totals(p) for p in _PAPERS),
+        get_distinct_books(),
+    )
+    texts, books_text = await asyncio.to_thread(_render_all, fetched, books)
+    _RENDERED.update(texts)
+    if books_text is not None:
+        _RENDERED_BOOKS = books_text
+
+
+def _render_all(fetched: list[tuple[list[Topic], dict[str, int]]],
+                books: list[dict]) -> tuple[dict[int | None, str], str | None]:
+    texts = {
+        paper: _render_syllabus(topics, totals, paper)
+        for paper, (topics, totals) in zip(_PAPERS, fetched)
+        if topics   # don't pin empty output before the DB is seeded
+    }
+    return texts, (_render_books(books) if books else None)
+
 
 async def get_syllabus_summary(paper: int | None = None) -> str:
-    topics = await get_all_topics(paper)
+    text = _RENDERED.get(paper)
+    if text is None:
+        text = await _render_syllabus_summary(paper)
+        if text is not None:
+            _RENDERED[paper] = text
+    return text or "❌ No syllabus data found."
+
+
+async def _render_syllabus_summary(paper: int | None) -> str | None:
+    """Fetch on the loop, format in a worker thread."""
+    topics, totals = await get_cached_topics_with_totals(paper)
     if not topics:
-        return "❌ No syllabus data found."
+        return None
+    return await asyncio.to_thread(_render_syllabus, topics, totals, paper)
 
+
+def _render_syllabus(topics: list[Topic], totals: dict[str, int],
+                     paper: int | None) -> str:
     # Group by section
-    sections: dict[str, list] = {}
+    sections: defaultdict[str, list[Topic]] = defaultdict(list)
     for t in topics:
-        sec = t['section']
-        sections.setdefault(sec, []).append(t)
+        sections[t.section].append(t)
 
-    lines = []
+    buf = io.StringIO()
+    w = buf.write
     if paper == 2:
-        lines.append("📚 *PAPER II — Biology Syllabus*\n")
+        w("📚 *PAPER II — Biology Syllabus*\n")
     elif paper == 1:
-        lines.append("📚 *PAPER I — General Knowledge Syllabus*\n")
+        w("📚 *PAPER I — General Knowledge Syllabus*\n")
     else:
-        lines.append("📚 *Complete RPSC Syllabus*\n")
+        w("📚 *Complete RPSC Syllabus*\n")
 
     for section, topics_in_sec in sections.items():
-        emoji = SECTION_EMOJIS.get(section, "📌")
-        total_marks = sum(t['marks_weight'] for t in topics_in_sec)
-        lines.append(f"\n{emoji} *{section}* _(~{total_marks} marks)_")
+        header = _SECTION_HEADER_FMT.get(section)
+        if header:
+            w(header(totals[section]))
+        else:
+            w(f"\n\n📌 *{section}* _(~{totals[section]} marks)_")
         for t in topics_in_sec:
-            pri  = PRIORITY_EMOJI.get(t['priority'], "⚪")
-            line = (
-                f"  {pri} *{t['name']}*\n"
-                f"     📊 {t['marks_weight']} marks | ⏱️ Target: {t['target_hours']}h\n"
-                f"     📖 {t['recommended_books']}\n"
-                f"     🔗 [Free PDF]({t['free_pdf_link']})"
+            name, marks, hours, books, pdf, prio = _topic_fields(t)
+            w(_PRI_PREFIX.get(prio, "\n  ⚪ *"))
+            w(
+                f"{name}*\n"
+                f"     📊 {marks} marks | ⏱️ Target: {hours}h\n"
+                f"     📖 {books}\n"
+                f"     🔗 [Free PDF]({pdf})"
             )
-            lines.append(line)
-
-    return "\n".join(lines)
+    return buf.getvalue()
 
 
 async def get_topic_detail(topic_id: int) -> str:
@@ -62,35 +141,46 @@ async def get_topic_detail(topic_id: int) -> str:
     if not t:
         return "❌ Topic not found."
 
-    emoji = SECTION_EMOJIS.get(t['section'], "📌")
-    pri   = PRIORITY_EMOJI.get(t['priority'], "⚪")
+    section, prio = t.section, t.priority
+    emoji, pri = _COMBO.get((section, prio)) or (
+        SECTION_EMOJIS.get(section, "📌"), PRIORITY_EMOJI.get(prio, "⚪")
+    )
 
     text = (
-        f"{emoji} *{t['name']}*\n\n"
-        f"{pri} Priority: *{t['priority']}*\n"
-        f"📊 Marks Weight: *{t['marks_weight']}*\n"
-        f"📅 PYQ Weight: *{t.get('pyq_weight', 'N/A')}*\n"
-        f"⏱️ Target Hours: *{t['target_hours']}h*\n"
-        f"📝 Section: *{t['section']}*\n\n"
-        f"📖 *Recommended Books:*\n{t['recommended_books']}\n\n"
-        f"🔗 *Free PDF:* [Click Here]({t['free_pdf_link']})"
+        f"{emoji} *{t.name}*\n\n"
+        f"{pri} Priority: *{prio}*\n"
+        f"📊 Marks Weight: *{t.marks_weight}*\n"
+        f"📅 PYQ Weight: *{t.pyq_weight}*\n"
+        f"⏱️ Target Hours: *{t.target_hours}h*\n"
+        f"📝 Section: *{section}*\n\n"
+        f"📖 *Recommended Books:*\n{t.recommended_books}\n\n"
+        f"🔗 *Free PDF:* [Click Here]({t.free_pdf_link})"
     )
     return text
 
 
 async def get_books_list() -> str:
-    topics = await get_all_topics()
-    seen = set()
-    lines = ["📚 *Recommended Books & FREE PDFs*\n"]
-    for t in sorted(topics, key=lambda x: (x['paper'], x['section'])):
-        key = t['free_pdf_link']
-        if key in seen:
-            continue
-        seen.add(key)
-        emoji = SECTION_EMOJIS.get(t['section'], "📌")
-        lines.append(
-            f"{emoji} *{t['name']}*\n"
-            f"   📖 {t['recommended_books']}\n"
-            f"   🔗 [Download FREE PDF]({t['free_pdf_link']})"
+    global _RENDERED_BOOKS
+    if _RENDERED_BOOKS is None:
+        books = await get_distinct_books()
+        text = await asyncio.to_thread(_render_books, books)
+        if not books:   # don't pin an empty list before the DB is seeded
+            return text
+        _RENDERED_BOOKS = text
+    return _RENDERED_BOOKS
+
+
+def _render_books(books: list[dict]) -> str:
+    return "\n\n".join(_iter_book_entries(books))
+
+
+def _iter_book_entries(books: list[dict]):
+    yield "📚 *Recommended Books & FREE PDFs*\n"
+    for t in books:   # already deduped and ordered by get_distinct_books
+        name, section, rec, pdf = _book_fields(t)
+        emoji = SECTION_EMOJIS.get(section, "📌")
+        yield (
+            f"{emoji} *{name}*\n"
+            f"   📖 {rec}\n"
+            f"   🔗 [Download FREE PDF]({pdf})"
         )
-    return "\n\n".join(lines)